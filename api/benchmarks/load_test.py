@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test for the chat API.
+
+Starts the mock NextAGI upstream (mock_upstream.py) and the API itself in
+throwaway subprocesses, then drives /chat, /ws, /upload and the /chatbots CRUD
+routes with N concurrent clients. Results are written as JSON so runs can be
+compared between commits:
+
+    python benchmarks/load_test.py --clients 50 --iterations 4 --output before.json
+    python benchmarks/load_test.py --clients 50 --iterations 4 --output after.json --compare before.json
+
+Reported per scenario: throughput, p50/p99 latency and time-to-first-token,
+per-token overhead over the mock's own pacing, API CPU time per stream and API
+resident memory per open WebSocket. CPU and memory are read from /proc, so they
+are only reported on Linux.
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+import websockets
+
+API_DIR = Path(__file__).resolve().parent.parent
+BENCH_DIR = Path(__file__).resolve().parent
+
+SAMPLE_CHATBOT = {
+    "name": "Load test bot",
+    "chatLogoColor": "#3884db",
+    "chatHeaderColor": "#b4c7c5",
+    "chatBgGradientStart": "#ffffff",
+    "chatBgGradientEnd": "#6398d5",
+    "welcomeText": "Welcome to our assistant! How can I help you today?",
+    "apiKey": "app-loadtest",
+}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Nothing listening on port {port} after {timeout}s")
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+class ProcessStats:
+    """CPU time and resident memory of a process, read from /proc"""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+    def cpu_seconds(self) -> Optional[float]:
+        try:
+            with open(f"/proc/{self.pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            # utime and stime are fields 14 and 15 of /proc/<pid>/stat
+            return (int(fields[11]) + int(fields[12])) / self.ticks
+        except (OSError, IndexError, ValueError):
+            return None
+
+    def rss_kb(self) -> Optional[int]:
+        try:
+            with open(f"/proc/{self.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1])
+        except (OSError, ValueError):
+            pass
+        return None
+
+
+def summarize(samples: List[Dict[str, Any]], wall_seconds: float, expected_stream_seconds: Optional[float],
+              cpu_seconds: Optional[float]) -> Dict[str, Any]:
+    """Reduce raw samples to the machine-readable metrics for one scenario"""
+    ok = [s for s in samples if s["ok"]]
+    latencies = [s["latency"] * 1000 for s in ok]
+    ttfts = [s["ttft"] * 1000 for s in ok if s.get("ttft") is not None]
+    tokens = sum(s.get("tokens", 0) for s in ok)
+    streams = [s for s in ok if s.get("tokens")]
+
+    result = {
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_rps": round(len(ok) / wall_seconds, 2) if wall_seconds else None,
+        "latency_ms_p50": percentile(latencies, 50),
+        "latency_ms_p99": percentile(latencies, 99),
+    }
+    if ttfts:
+        result["ttft_ms_p50"] = percentile(ttfts, 50)
+        result["ttft_ms_p99"] = percentile(ttfts, 99)
+    if streams:
+        result["tokens"] = tokens
+        result["tokens_per_second"] = round(tokens / wall_seconds, 1) if wall_seconds else None
+        if expected_stream_seconds is not None:
+            overheads = [(s["latency"] - expected_stream_seconds) / s["tokens"] * 1000 for s in streams]
+            result["per_token_overhead_ms"] = round(sum(overheads) / len(overheads), 3)
+        payload = [s["bytes"] / s["tokens"] for s in streams if s.get("bytes")]
+        if payload:
+            result["payload_bytes_per_token"] = round(sum(payload) / len(payload), 1)
+        if cpu_seconds is not None:
+            result["cpu_ms_per_stream"] = round(cpu_seconds / len(streams) * 1000, 3)
+    elif cpu_seconds is not None and ok:
+        result["cpu_ms_per_request"] = round(cpu_seconds / len(ok) * 1000, 3)
+    for key in ("latency_ms_p50", "latency_ms_p99", "ttft_ms_p50", "ttft_ms_p99"):
+        if result.get(key) is not None:
+            result[key] = round(result[key], 2)
+    return result
+
+
+async def chat_client(client: httpx.AsyncClient, iterations: int) -> List[Dict[str, Any]]:
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        sample = {"ok": False, "ttft": None, "tokens": 0, "bytes": 0}
+        try:
+            async with client.stream("POST", "/chat", json={"query": "Hello"}) as response:
+                async for line in response.aiter_lines():
+                    if not line.startswith("data: "):
+                        continue
+                    sample["bytes"] += len(line) + 2
+                    event = json.loads(line[6:])
+                    if event["type"] == "fragment":
+                        if sample["ttft"] is None:
+                            sample["ttft"] = time.perf_counter() - start
+                        sample["tokens"] += 1
+                    elif event["type"] == "complete":
+                        sample["ok"] = True
+                    elif event["type"] == "error":
+                        break
+        except httpx.HTTPError:
+            pass
+        sample["latency"] = time.perf_counter() - start
+        samples.append(sample)
+    return samples
+
+
+async def ws_client(base_url: str, iterations: int, protocol: int) -> List[Dict[str, Any]]:
+    samples = []
+    url = f"{base_url}/ws/loadtest-{uuid.uuid4().hex}"
+    try:
+        async with websockets.connect(url, max_size=None) as ws:
+            await ws.send(json.dumps({"type": "init", "api_key": "app-loadtest", "protocol": protocol}))
+            await ws.recv()  # protocol acknowledgement
+            for _ in range(iterations):
+                start = time.perf_counter()
+                sample = {"ok": False, "ttft": None, "tokens": 0, "bytes": 0}
+                await ws.send(json.dumps({"query": "Hello", "conversation_id": ""}))
+                while True:
+                    frame = await ws.recv()
+                    sample["bytes"] += len(frame)
+                    if isinstance(frame, bytes):
+                        is_chunk, is_end, is_error = frame[:1] == b"\x01", False, False
+                    else:
+                        data = json.loads(frame)
+                        kind = data.get("type") or data.get("t")
+                        is_chunk = kind == "chunk" and bool(data.get("content"))
+                        is_end = kind in ("end", "e")
+                        is_error = kind in ("error", "x")
+                    if is_chunk:
+                        if sample["ttft"] is None:
+                            sample["ttft"] = time.perf_counter() - start
+                        sample["tokens"] += 1
+                    elif is_end:
+                        sample["ok"] = True
+                        break
+                    elif is_error:
+                        break
+                sample["latency"] = time.perf_counter() - start
+                samples.append(sample)
+    except (OSError, websockets.WebSocketException):
+        samples.append({"ok": False, "latency": 0.0})
+    return samples
+
+
+async def upload_client(client: httpx.AsyncClient, iterations: int, size: int) -> List[Dict[str, Any]]:
+    samples = []
+    payload = os.urandom(size)
+    for i in range(iterations):
+        start = time.perf_counter()
+        try:
+            response = await client.post(
+                "/upload",
+                files={"file": (f"loadtest-{uuid.uuid4().hex[:8]}.bin", payload, "application/octet-stream")},
+                data={"user": "loadtest"},
+            )
+            ok = response.status_code == 200
+        except httpx.HTTPError:
+            ok = False
+        samples.append({"ok": ok, "latency": time.perf_counter() - start})
+    return samples
+
+
+async def crud_client(client: httpx.AsyncClient, iterations: int) -> Dict[str, List[Dict[str, Any]]]:
+    samples: Dict[str, List[Dict[str, Any]]] = {"create": [], "get": [], "update": [], "list": [], "delete": []}
+
+    async def timed(op, call):
+        start = time.perf_counter()
+        try:
+            response = await call
+            ok = response.status_code < 400
+        except httpx.HTTPError:
+            response, ok = None, False
+        samples[op].append({"ok": ok, "latency": time.perf_counter() - start})
+        return response if ok else None
+
+    for _ in range(iterations):
+        created = await timed("create", client.post("/chatbots", json=SAMPLE_CHATBOT))
+        if created is None:
+            continue
+        unique_id = created.json()["chatbot"]["uniqueId"]
+        await timed("get", client.get(f"/chatbots/{unique_id}"))
+        await timed("update", client.put(f"/chatbots/{unique_id}", json={**SAMPLE_CHATBOT, "welcomeText": "Updated"}))
+        await timed("list", client.get("/chatbots"))
+        await timed("delete", client.delete(f"/chatbots/{unique_id}"))
+    return samples
+
+
+async def measure_ws_memory(base_url: str, connections: int, stats: ProcessStats) -> Optional[float]:
+    """Open idle WebSockets and report the API's resident memory growth per socket"""
+    before = stats.rss_kb()
+    sockets = []
+    try:
+        for _ in range(connections):
+            ws = await websockets.connect(f"{base_url}/ws/idle-{uuid.uuid4().hex}")
+            await ws.send(json.dumps({"type": "init", "api_key": "app-loadtest", "protocol": 2}))
+            await ws.recv()
+            sockets.append(ws)
+        await asyncio.sleep(1.0)
+        after = stats.rss_kb()
+    finally:
+        await asyncio.gather(*(ws.close() for ws in sockets), return_exceptions=True)
+    if before is None or after is None or not sockets:
+        return None
+    return round((after - before) / len(sockets), 2)
+
+
+async def run_scenarios(args, api_port: int, stats: ProcessStats) -> Dict[str, Any]:
+    http_base = f"http://127.0.0.1:{api_port}"
+    ws_base = f"ws://127.0.0.1:{api_port}"
+    expected_stream = args.latency_ms / 1000.0 + (args.tokens / args.token_rate if args.token_rate > 0 else 0.0)
+    limits = httpx.Limits(max_connections=args.clients, max_keepalive_connections=args.clients)
+    results: Dict[str, Any] = {}
+
+    async with httpx.AsyncClient(base_url=http_base, timeout=120.0, limits=limits) as client:
+        for scenario in args.scenarios:
+            cpu_before = stats.cpu_seconds()
+            start = time.perf_counter()
+            if scenario == "chat":
+                batches = await asyncio.gather(*(chat_client(client, args.iterations) for _ in range(args.clients)))
+            elif scenario == "ws":
+                batches = await asyncio.gather(*(ws_client(ws_base, args.iterations, args.ws_protocol)
+                                                 for _ in range(args.clients)))
+            elif scenario == "upload":
+                batches = await asyncio.gather(*(upload_client(client, args.iterations, args.upload_bytes)
+                                                 for _ in range(args.clients)))
+            elif scenario == "crud":
+                per_client = await asyncio.gather(*(crud_client(client, args.iterations) for _ in range(args.clients)))
+                wall = time.perf_counter() - start
+                cpu_after = stats.cpu_seconds()
+                cpu = cpu_after - cpu_before if cpu_before is not None and cpu_after is not None else None
+                for op in ("create", "get", "update", "list", "delete"):
+                    op_samples = [s for client_samples in per_client for s in client_samples[op]]
+                    results[f"crud_{op}"] = summarize(op_samples, wall, None, None)
+                total = sum(r["requests"] - r["errors"] for k, r in results.items() if k.startswith("crud_"))
+                if cpu is not None and total:
+                    results["crud_create"]["cpu_ms_per_crud_request"] = round(cpu / total * 1000, 3)
+                continue
+            else:
+                raise ValueError(f"Unknown scenario: {scenario}")
+            wall = time.perf_counter() - start
+            cpu_after = stats.cpu_seconds()
+            cpu = cpu_after - cpu_before if cpu_before is not None and cpu_after is not None else None
+            samples = [s for batch in batches for s in batch]
+            streaming = scenario in ("chat", "ws")
+            results[scenario] = summarize(samples, wall, expected_stream if streaming else None, cpu)
+
+        if "ws" in args.scenarios:
+            results.setdefault("ws", {})["rss_kb_per_connection"] = await measure_ws_memory(
+                ws_base, args.clients, stats)
+    return results
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=API_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]):
+    """Print relative change of every numeric metric against a previous run"""
+    print(f"\nComparison against {baseline['meta'].get('commit')} ({baseline['meta'].get('timestamp')})")
+    for scenario, metrics in current["scenarios"].items():
+        previous = baseline["scenarios"].get(scenario, {})
+        for name, value in metrics.items():
+            old = previous.get(name)
+            if isinstance(value, (int, float)) and isinstance(old, (int, float)) and old:
+                change = (value - old) / old * 100
+                print(f"  {scenario:<14} {name:<26} {old:>12} -> {value:>12}  ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the chat API against a local mock upstream")
+    parser.add_argument("--clients", type=int, default=20, help="concurrent clients per scenario")
+    parser.add_argument("--iterations", type=int, default=5, help="requests per client per scenario")
+    parser.add_argument("--scenarios", default="chat,ws,upload,crud",
+                        type=lambda value: [s.strip() for s in value.split(",") if s.strip()])
+    parser.add_argument("--ws-protocol", type=int, default=2, choices=(1, 2))
+    parser.add_argument("--upload-bytes", type=int, default=64 * 1024)
+    parser.add_argument("--tokens", type=int, default=100, help="tokens per mock answer")
+    parser.add_argument("--token-rate", type=float, default=200.0, help="mock tokens per second (0 = unpaced)")
+    parser.add_argument("--latency-ms", type=float, default=100.0, help="mock delay before the first token")
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--api-port", type=int, default=0, help="0 picks a free port")
+    parser.add_argument("--mock-port", type=int, default=0, help="0 picks a free port")
+    parser.add_argument("--output", help="write results JSON to this file")
+    parser.add_argument("--compare", help="baseline results JSON to compare against")
+    args = parser.parse_args()
+
+    mock_port = args.mock_port or free_port()
+    api_port = args.api_port or free_port()
+    workdir = tempfile.mkdtemp(prefix="chat-loadtest-")
+    processes = []
+    try:
+        mock = subprocess.Popen([
+            sys.executable, str(BENCH_DIR / "mock_upstream.py"), "--port", str(mock_port),
+            "--tokens", str(args.tokens), "--token-rate", str(args.token_rate),
+            "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+            "--error-rate", str(args.error_rate),
+        ])
+        processes.append(mock)
+        # The API runs from a scratch directory so uploads and local storage stay out of the tree
+        api_env = {
+            **os.environ,
+            "NEXT_AGI_BASE_URL": f"http://127.0.0.1:{mock_port}/v1",
+            "NEXT_AGI_API_KEY": "app-loadtest",
+        }
+        api = subprocess.Popen([
+            sys.executable, "-m", "uvicorn", "main:app", "--app-dir", str(API_DIR),
+            "--host", "127.0.0.1", "--port", str(api_port), "--log-level", "warning",
+        ], cwd=workdir, env=api_env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        processes.append(api)
+        wait_for_port(mock_port)
+        wait_for_port(api_port)
+
+        scenarios = asyncio.run(run_scenarios(args, api_port, ProcessStats(api.pid)))
+        report = {
+            "meta": {
+                "commit": git_commit(),
+                "timestamp": datetime.datetime.now().isoformat(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+            },
+            "scenarios": scenarios,
+        }
+        print(json.dumps(report, indent=2))
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=2)
+        if args.compare:
+            with open(args.compare) as f:
+                compare(report, json.load(f))
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+if __name__ == "__main__":
+    main()
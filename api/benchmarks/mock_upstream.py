@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Local mock of the NextAGI API for load testing.
+
+Serves the two upstream endpoints the chat API talks to:
+
+* POST /v1/chat-messages  - streams an answer as Server-Sent Events
+* POST /v1/files/upload   - accepts a multipart upload and returns file metadata
+
+Token rate, initial latency, jitter and error injection are configurable from
+the command line (or MOCK_* environment variables when started by load_test.py):
+
+    python benchmarks/mock_upstream.py --port 9001 --tokens 200 --token-rate 50 \\
+        --latency-ms 300 --jitter-ms 50 --error-rate 0.01
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import uuid
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+# Mock behaviour, overridable from the environment so the load test can configure workers
+MOCK_TOKENS = int(os.getenv("MOCK_TOKENS", "100"))
+MOCK_TOKEN_RATE = float(os.getenv("MOCK_TOKEN_RATE", "50"))  # tokens per second, 0 = as fast as possible
+MOCK_LATENCY_MS = float(os.getenv("MOCK_LATENCY_MS", "200"))  # delay before the first token
+MOCK_JITTER_MS = float(os.getenv("MOCK_JITTER_MS", "0"))  # +/- jitter applied to every delay
+MOCK_ERROR_RATE = float(os.getenv("MOCK_ERROR_RATE", "0"))  # fraction of requests answered with HTTP 500
+MOCK_TOKEN_TEXT = os.getenv("MOCK_TOKEN_TEXT", " token")
+
+
+def _delay(base_seconds: float) -> float:
+    jitter = MOCK_JITTER_MS / 1000.0
+    if jitter:
+        base_seconds += random.uniform(-jitter, jitter)
+    return max(base_seconds, 0.0)
+
+
+def _event(payload) -> str:
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+async def chat_messages(request: Request):
+    """Stream MOCK_TOKENS tokens in the NextAGI SSE format"""
+    body = await request.json()
+    if MOCK_ERROR_RATE and random.random() < MOCK_ERROR_RATE:
+        return JSONResponse({"code": "internal_error", "message": "injected failure"}, status_code=500)
+
+    conversation_id = body.get("conversation_id") or str(uuid.uuid4())
+    if conversation_id in ("None", ""):
+        conversation_id = str(uuid.uuid4())
+    message_id = str(uuid.uuid4())
+    interval = 1.0 / MOCK_TOKEN_RATE if MOCK_TOKEN_RATE > 0 else 0.0
+
+    async def stream():
+        await asyncio.sleep(_delay(MOCK_LATENCY_MS / 1000.0))
+        for _ in range(MOCK_TOKENS):
+            # Both answer shapes are emitted: /ws reads "answer", /chat reads "message.content"
+            yield _event({
+                "event": "message",
+                "message_id": message_id,
+                "conversation_id": conversation_id,
+                "answer": MOCK_TOKEN_TEXT,
+                "message": {"content": MOCK_TOKEN_TEXT},
+            })
+            if interval:
+                await asyncio.sleep(_delay(interval))
+        yield _event({
+            "event": "message_end",
+            "message_id": message_id,
+            "conversation_id": conversation_id,
+        })
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+async def files_upload(request: Request):
+    """Accept a multipart upload and describe it like the real endpoint does"""
+    if MOCK_ERROR_RATE and random.random() < MOCK_ERROR_RATE:
+        return JSONResponse({"code": "internal_error", "message": "injected failure"}, status_code=500)
+    form = await request.form()
+    upload = form.get("file")
+    content = await upload.read() if upload is not None else b""
+    await asyncio.sleep(_delay(MOCK_LATENCY_MS / 1000.0))
+    return JSONResponse({
+        "id": str(uuid.uuid4()),
+        "name": getattr(upload, "filename", "file"),
+        "size": len(content),
+        "mime_type": getattr(upload, "content_type", None),
+        "created_by": form.get("user"),
+    })
+
+
+app = Starlette(routes=[
+    Route("/v1/chat-messages", chat_messages, methods=["POST"]),
+    Route("/v1/files/upload", files_upload, methods=["POST"]),
+])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock NextAGI upstream for load testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9001)
+    parser.add_argument("--tokens", type=int, default=MOCK_TOKENS)
+    parser.add_argument("--token-rate", type=float, default=MOCK_TOKEN_RATE)
+    parser.add_argument("--latency-ms", type=float, default=MOCK_LATENCY_MS)
+    parser.add_argument("--jitter-ms", type=float, default=MOCK_JITTER_MS)
+    parser.add_argument("--error-rate", type=float, default=MOCK_ERROR_RATE)
+    args = parser.parse_args()
+
+    # Export the settings so every uvicorn worker picks them up on import
+    os.environ.update({
+        "MOCK_TOKENS": str(args.tokens),
+        "MOCK_TOKEN_RATE": str(args.token_rate),
+        "MOCK_LATENCY_MS": str(args.latency_ms),
+        "MOCK_JITTER_MS": str(args.jitter_ms),
+        "MOCK_ERROR_RATE": str(args.error_rate),
+    })
+
+    import uvicorn
+    uvicorn.run(
+        "mock_upstream:app",
+        host=args.host,
+        port=args.port,
+        app_dir=os.path.dirname(os.path.abspath(__file__)),
+        log_level="warning",
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Import-time profile and cold-start measurement for the API.
+
+* Import profile: runs ``python -X importtime -c "import main"`` and reports the
+  total and the slowest modules, by cumulative and by self time.
+* Cold start: launches uvicorn in a fresh process, then records the time until
+  the port answers (``GET /``) and until ``/readyz`` reports the warm-up done.
+
+    python benchmarks/startup_profile.py --runs 5 --top 15 --output startup.json
+
+Point POSTGRES_* or NEXT_AGI_BASE_URL at an unreachable host to check that a dead
+dependency no longer delays binding.
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+API_DIR = Path(__file__).resolve().parent.parent
+
+
+def import_profile(top: int) -> Dict[str, Any]:
+    """Parse -X importtime output for ``import main``"""
+    child = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                           cwd=API_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    modules = []
+    for line in child.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # Nesting is shown by two spaces of indent per level after the column separator
+        modules.append({"module": name.strip(), "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+                        "self_ms": int(self_us) / 1000, "cumulative_ms": int(cumulative_us) / 1000})
+    main_entry = next((m for m in modules if m["module"] == "main"), None)
+    top_level = [m for m in modules if m["depth"] <= 1 and m["module"] != "main"]
+    return {
+        "total_ms": main_entry["cumulative_ms"] if main_entry else None,
+        "top_cumulative": sorted(top_level, key=lambda m: -m["cumulative_ms"])[:top],
+        "top_self": sorted(modules, key=lambda m: -m["self_ms"])[:top],
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def get(url: str) -> Optional[int]:
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return None
+
+
+def cold_start(timeout: float) -> Dict[str, Any]:
+    """Seconds from process launch to the first answered request and to readiness"""
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=API_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    result: Dict[str, Any] = {"listening_ms": None, "ready_ms": None}
+    try:
+        while time.perf_counter() - start < timeout:
+            if result["listening_ms"] is None and get(base + "/") is not None:
+                result["listening_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            if result["listening_ms"] is not None and get(base + "/readyz") == 200:
+                result["ready_ms"] = round((time.perf_counter() - start) * 1000, 1)
+                break
+            time.sleep(0.01)
+    finally:
+        server.terminate()
+        server.wait()
+    return result
+
+
+def median(values: List[Optional[float]]) -> Optional[float]:
+    values = [v for v in values if v is not None]
+    return round(statistics.median(values), 1) if values else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile API imports and cold start")
+    parser.add_argument("--runs", type=int, default=5, help="cold starts to measure")
+    parser.add_argument("--top", type=int, default=15, help="modules listed in the import profile")
+    parser.add_argument("--timeout", type=float, default=30.0, help="give up on a cold start after this many seconds")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    profile = import_profile(args.top)
+    print(f"import main: {profile['total_ms']} ms")
+    print("\nslowest imports (cumulative):")
+    for m in profile["top_cumulative"]:
+        print(f"  {m['cumulative_ms']:9.1f} ms  {m['module']}")
+    print("\nslowest imports (self):")
+    for m in profile["top_self"]:
+        print(f"  {m['self_ms']:9.1f} ms  {m['module']}")
+
+    runs = [cold_start(args.timeout) for _ in range(args.runs)]
+    summary = {
+        "listening_ms_median": median([r["listening_ms"] for r in runs]),
+        "ready_ms_median": median([r["ready_ms"] for r in runs]),
+    }
+    print(f"\ncold start over {args.runs} runs: listening {summary['listening_ms_median']} ms, "
+          f"ready {summary['ready_ms_median']} ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"import_profile": profile, "cold_start": {"runs": runs, **summary}}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
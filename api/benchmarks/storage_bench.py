@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+Storage backend benchmark at realistic data sizes.
+
+Seeds each backend with synthetic chatbots (including base64 image payloads)
+and measures get-by-id, list, create, update and delete throughput and latency
+under concurrency through the same module functions the API calls. For
+PostgreSQL it also reports row and TOAST sizes and WAL bytes per operation:
+
+* ``pg``    - database_pg against POSTGRES_* (a local instance or any compatible stand-in)
+* ``mongo`` - database against MONGODB_URI (a local mongod or any compatible stand-in)
+* ``local`` - the local_storage JSON fallback, reached the way production reaches it:
+              database_pg with PostgreSQL unreachable
+
+    python benchmarks/storage_bench.py --backends local,pg --rows 10000 --concurrency 8 \\
+        --output storage.json --markdown storage.md
+
+Each backend runs in its own subprocess, against its own database
+(``--pg-db``/``--mongo-db``, default ``*_bench``) and a scratch working directory.
+Seeded rows use the ``bench-`` uniqueId prefix and are removed afterwards.
+"""
+
+import argparse
+import base64
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+API_DIR = Path(__file__).resolve().parent.parent
+OPERATIONS = ("get", "list", "create", "update", "update_image", "delete")
+SEED_BATCH = 1000
+
+
+def make_chatbot(index: int, image_kb: int, background_kb: int, image_fraction: float,
+                 rng: random.Random) -> Dict[str, Any]:
+    """Build one synthetic chatbot in the API's camelCase format"""
+    def image(kb: int) -> str:
+        raw = rng.randbytes(kb * 768) if hasattr(rng, "randbytes") else os.urandom(kb * 768)
+        return "data:image/png;base64," + base64.b64encode(raw).decode()
+
+    with_images = rng.random() < image_fraction
+    return {
+        "id": str(100000000 + index),
+        "uniqueId": f"bench-{index:08d}",
+        "name": f"Benchmark bot {index}",
+        "chatLogoColor": "#3884db",
+        "chatLogoImage": image(image_kb) if with_images else "",
+        "iconAvatarImage": image(image_kb) if with_images else "",
+        "staticImage": "",
+        "chatHeaderColor": "#b4c7c5",
+        "chatBgGradientStart": "#ffffff",
+        "chatBgGradientEnd": "#6398d5",
+        "bodyBackgroundImage": image(background_kb) if with_images and background_kb else "",
+        "welcomeText": f"Welcome to benchmark bot {index}! How can I help you today?",
+        "apiKey": f"app-bench{index:08d}",
+        "analyticsUrl": None,
+    }
+
+
+def generate(rows: int, args, seed: int = 1) -> Iterator[List[Dict[str, Any]]]:
+    """Yield seed rows in batches so 100k-row datasets never sit in memory at once"""
+    rng = random.Random(seed)
+    for start in range(0, rows, SEED_BATCH):
+        yield [make_chatbot(i, args.image_kb, args.background_kb, args.image_fraction, rng)
+               for i in range(start, min(rows, start + SEED_BATCH))]
+
+
+class PostgresBackend:
+    name = "pg"
+
+    def __init__(self, args):
+        os.environ["POSTGRES_DB"] = args.pg_db
+        import database_pg
+        self.module = database_pg
+        if not database_pg.init_db():
+            raise RuntimeError(f"PostgreSQL database {args.pg_db} on {database_pg.DB_HOST} is not reachable")
+
+    def seed(self, batches: Iterator[List[Dict[str, Any]]]):
+        writer = self.module.BulkWriter(upsert=True)
+        writer.open()
+        try:
+            for batch in batches:
+                writer.write_batch(list(enumerate(batch)))
+            writer.commit()
+        finally:
+            writer.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self.module.get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT (SELECT COUNT(*) FROM chatbots), pg_total_relation_size('chatbots'), pg_relation_size('chatbots'),
+                           COALESCE(pg_total_relation_size(NULLIF(reltoastrelid, 0)), 0),
+                           (SELECT AVG(pg_column_size(c.*))::BIGINT FROM chatbots c)
+                    FROM pg_class WHERE oid = 'chatbots'::regclass
+                """)
+                count, size, heap, toast, row = cur.fetchone()
+        return {"rows": count, "total_bytes": size, "heap_bytes": heap, "toast_bytes": toast,
+                "avg_row_bytes": row}
+
+    def wal_position(self) -> Optional[int]:
+        """Current WAL insert position in bytes, to attribute WAL volume to each operation"""
+        with self.module.get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_wal_lsn_diff(pg_current_wal_insert_lsn(), '0/0')::BIGINT")
+                return cur.fetchone()[0]
+
+    def cleanup(self):
+        with self.module.get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM chatbots WHERE unique_id LIKE 'bench-%%'")
+                conn.commit()
+
+
+class MongoBackend:
+    name = "mongo"
+
+    def __init__(self, args):
+        os.environ["MONGODB_DB"] = args.mongo_db
+        import database
+        self.module = database
+        if not database.using_mongodb:
+            raise RuntimeError(f"MongoDB at {database.MONGODB_URI} is not reachable")
+
+    def seed(self, batches: Iterator[List[Dict[str, Any]]]):
+        for batch in batches:
+            self.module.db.chatbots.insert_many(batch, ordered=False)
+
+    def stats(self) -> Dict[str, Any]:
+        collection_stats = self.module.db.command("collStats", "chatbots")
+        return {"rows": collection_stats.get("count"), "total_bytes": collection_stats.get("totalSize")}
+
+    def wal_position(self) -> Optional[int]:
+        return None
+
+    def cleanup(self):
+        self.module.db.chatbots.delete_many({"uniqueId": {"$regex": "^bench-"}})
+
+
+class LocalBackend:
+    name = "local"
+
+    def __init__(self, args):
+        # Point PostgreSQL at a closed port so database_pg takes its local-storage fallback
+        os.environ["POSTGRES_HOST"] = "127.0.0.1"
+        os.environ["POSTGRES_PORT"] = str(args.closed_port)
+        import database_pg
+        self.module = database_pg
+
+    def seed(self, batches: Iterator[List[Dict[str, Any]]]):
+        # Stream the JSON document out batch by batch rather than going through create_chatbot,
+        # which rewrites the whole file per row
+        with open(self.module.LOCAL_STORAGE_FILE, "w") as f:
+            f.write('{"chatbots": [')
+            first = True
+            for batch in batches:
+                for bot in batch:
+                    f.write(("" if first else ",") + json.dumps(bot))
+                    first = False
+            f.write("]}")
+
+    def stats(self) -> Dict[str, Any]:
+        with open(self.module.LOCAL_STORAGE_FILE) as f:
+            rows = len(json.load(f)["chatbots"])
+        return {"rows": rows, "total_bytes": self.module.LOCAL_STORAGE_FILE.stat().st_size}
+
+    def wal_position(self) -> Optional[int]:
+        return None
+
+    def cleanup(self):
+        self.module.LOCAL_STORAGE_FILE.unlink(missing_ok=True)
+
+
+BACKENDS = {backend.name: backend for backend in (PostgresBackend, MongoBackend, LocalBackend)}
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+def measure(pool: ThreadPoolExecutor, count: int, call: Callable[[int], Any]) -> Dict[str, Any]:
+    """Run ``call(i)`` for i in range(count) on the pool, timing every call"""
+    def timed(i):
+        start = time.perf_counter()
+        try:
+            ok = call(i) not in (None, False)
+        except Exception:
+            ok = False
+        return ok, time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = list(pool.map(timed, range(count)))
+    wall = time.perf_counter() - start
+    latencies = [latency * 1000 for ok, latency in results if ok]
+    return {
+        "ops": count,
+        "errors": sum(1 for ok, _ in results if not ok),
+        "wall_seconds": round(wall, 3),
+        "ops_per_second": round(len(latencies) / wall, 2) if wall else None,
+        "latency_ms_p50": round(percentile(latencies, 50), 3) if latencies else None,
+        "latency_ms_p95": round(percentile(latencies, 95), 3) if latencies else None,
+        "latency_ms_p99": round(percentile(latencies, 99), 3) if latencies else None,
+    }
+
+
+def run_backend(args) -> Dict[str, Any]:
+    """Seed one backend and measure every operation (runs inside the child process)"""
+    backend = BACKENDS[args.run_backend](args)
+    module = backend.module
+    rng = random.Random(2)
+    result: Dict[str, Any] = {"backend": backend.name}
+    try:
+        start = time.perf_counter()
+        backend.seed(generate(args.rows, args))
+        result["seed_seconds"] = round(time.perf_counter() - start, 3)
+        result["dataset"] = backend.stats()
+
+        seeded_ids = [f"bench-{i:08d}" for i in range(args.rows)]
+        new_rows = [make_chatbot(args.rows + i, args.image_kb, args.background_kb, args.image_fraction, rng)
+                    for i in range(args.ops)]
+
+        new_logo = make_chatbot(0, args.image_kb, 0, 1.0, rng)["chatLogoImage"]
+
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            def tracked(count: int, call: Callable[[int], Any]) -> Dict[str, Any]:
+                # Write amplification: WAL generated per operation, where the backend exposes it
+                wal_start = backend.wal_position()
+                stats = measure(pool, count, call)
+                if wal_start is not None:
+                    stats["wal_bytes_per_op"] = round((backend.wal_position() - wal_start) / count)
+                return stats
+
+            result["get"] = tracked(args.ops, lambda i: module.get_chatbot_by_unique_id(rng.choice(seeded_ids)))
+            result["list"] = tracked(args.list_ops, lambda i: module.get_all_chatbots())
+            result["create"] = tracked(args.ops, lambda i: module.create_chatbot(new_rows[i]))
+            result["update"] = tracked(args.ops, lambda i: module.update_chatbot(
+                rng.choice(seeded_ids), {"welcomeText": f"Updated {i}"}))
+            result["update_image"] = tracked(args.ops, lambda i: module.update_chatbot(
+                rng.choice(seeded_ids), {"chatLogoImage": new_logo}))
+            result["delete"] = tracked(args.ops, lambda i: module.delete_chatbot(new_rows[i]["uniqueId"]))
+    finally:
+        backend.cleanup()
+    return result
+
+
+def markdown_report(report: Dict[str, Any]) -> str:
+    lines = [
+        f"# Storage benchmark ({report['meta']['timestamp']})",
+        "",
+        f"rows={report['meta']['config']['rows']}, concurrency={report['meta']['config']['concurrency']}, "
+        f"image_kb={report['meta']['config']['image_kb']}, image_fraction={report['meta']['config']['image_fraction']}",
+        "",
+        "| backend | op | ops/s | p50 ms | p95 ms | p99 ms | WAL B/op | errors |",
+        "| --- | --- | ---: | ---: | ---: | ---: | ---: | ---: |",
+    ]
+    for name, result in report["backends"].items():
+        if "error" in result:
+            lines.append(f"| {name} | - | unavailable: {result['error']} | | | | | |")
+            continue
+        for op in OPERATIONS:
+            m = result[op]
+            lines.append(f"| {name} | {op} | {m['ops_per_second']} | {m['latency_ms_p50']} | "
+                         f"{m['latency_ms_p95']} | {m['latency_ms_p99']} | {m.get('wal_bytes_per_op', '-')} | "
+                         f"{m['errors']} |")
+    lines += ["", "| backend | rows | total bytes | heap bytes | TOAST bytes | avg row bytes |",
+              "| --- | ---: | ---: | ---: | ---: | ---: |"]
+    for name, result in report["backends"].items():
+        if "dataset" in result:
+            d = result["dataset"]
+            lines.append(f"| {name} | {d['rows']} | {d['total_bytes']} | {d.get('heap_bytes', '-')} | "
+                         f"{d.get('toast_bytes', '-')} | {d.get('avg_row_bytes', '-')} |")
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark chatbot storage backends")
+    parser.add_argument("--backends", default="local,pg,mongo")
+    parser.add_argument("--rows", type=int, default=10000, help="chatbots seeded before measuring")
+    parser.add_argument("--ops", type=int, default=1000, help="get/create/update/delete operations per backend")
+    parser.add_argument("--list-ops", type=int, default=10, help="full list calls per backend")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--image-kb", type=int, default=20, help="size of logo and avatar images")
+    parser.add_argument("--background-kb", type=int, default=100, help="size of the body background image")
+    parser.add_argument("--image-fraction", type=float, default=0.5, help="fraction of bots that carry images")
+    parser.add_argument("--pg-db", default=os.getenv("BENCH_POSTGRES_DB", "chatbot_bench"))
+    parser.add_argument("--mongo-db", default=os.getenv("BENCH_MONGODB_DB", "chatbots_bench"))
+    parser.add_argument("--closed-port", type=int, default=1, help="port used to force the local fallback")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--markdown", help="write a Markdown comparison table to this file")
+    parser.add_argument("--run-backend", choices=sorted(BACKENDS), help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_backend:
+        sys.path.insert(0, str(API_DIR))
+        result = run_backend(args)
+        with open(args.result_file, "w") as f:
+            json.dump(result, f)
+        return
+
+    report = {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": {k: v for k, v in vars(args).items()
+                       if k not in ("output", "markdown", "run_backend", "result_file")},
+        },
+        "backends": {},
+    }
+    for name in [b.strip() for b in args.backends.split(",") if b.strip()]:
+        workdir = tempfile.mkdtemp(prefix=f"storage-bench-{name}-")
+        result_file = os.path.join(workdir, "result.json")
+        child = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), *sys.argv[1:], "--run-backend", name,
+             "--result-file", result_file],
+            cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+        )
+        if child.returncode == 0 and os.path.exists(result_file):
+            with open(result_file) as f:
+                report["backends"][name] = json.load(f)
+        else:
+            last_line = (child.stderr.strip().splitlines() or ["unknown error"])[-1]
+            report["backends"][name] = {"backend": name, "error": last_line}
+        print(f"{name}: done", file=sys.stderr)
+
+    print(markdown_report(report))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.markdown:
+        with open(args.markdown, "w") as f:
+            f.write(markdown_report(report))
+
+
+if __name__ == "__main__":
+    main()
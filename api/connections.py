@@ -0,0 +1,180 @@
+"""
+WebSocket connection tracking for the /ws chat endpoint.
+
+Connections are keyed by a server-generated connection id (client ids sent by
+browsers are not guaranteed to be unique), capped per worker and per client IP,
+and reaped by a single background task once they have been idle for too long.
+Protocol-level ping/pong is handled by uvicorn using the intervals below.
+"""
+
+import asyncio
+import logging
+import os
+import time
+import uuid
+from typing import Dict, Iterable, Optional
+
+from fastapi import WebSocket
+from starlette.websockets import WebSocketState
+
+from ws_protocol import Frame, JsonFrameEncoder
+
+logger = logging.getLogger(__name__)
+
+# Heartbeat settings (seconds), passed to uvicorn's ws_ping_interval/ws_ping_timeout
+WS_PING_INTERVAL = float(os.getenv("WS_PING_INTERVAL", "20"))
+WS_PING_TIMEOUT = float(os.getenv("WS_PING_TIMEOUT", "20"))
+
+# Negotiate permessage-deflate with clients that offer it (all current browsers do)
+WS_PER_MESSAGE_DEFLATE = os.getenv("WS_PER_MESSAGE_DEFLATE", "true").lower() in ("1", "true", "yes")
+
+# Close sockets that have neither sent a message nor streamed an answer for this long
+WS_IDLE_TIMEOUT = float(os.getenv("WS_IDLE_TIMEOUT", "300"))
+
+# How often the reaper scans for idle connections
+WS_REAP_INTERVAL = float(os.getenv("WS_REAP_INTERVAL", "15"))
+
+# Connection caps per worker process and per client IP
+WS_MAX_CONNECTIONS = int(os.getenv("WS_MAX_CONNECTIONS", "10000"))
+WS_MAX_CONNECTIONS_PER_IP = int(os.getenv("WS_MAX_CONNECTIONS_PER_IP", "50"))
+
+# Close codes sent to clients
+CLOSE_GOING_AWAY = 1001
+CLOSE_TRY_AGAIN_LATER = 1013
+
+
+class Connection:
+    """A single accepted WebSocket and its bookkeeping"""
+
+    __slots__ = ("id", "websocket", "client_id", "client_ip", "connected_at", "last_activity", "streaming", "encoder")
+
+    def __init__(self, websocket: WebSocket, client_id: str, client_ip: str):
+        self.id = uuid.uuid4().hex
+        self.websocket = websocket
+        self.client_id = client_id
+        self.client_ip = client_ip
+        self.connected_at = time.monotonic()
+        self.last_activity = self.connected_at
+        self.streaming = False
+        # Frame encoding, upgraded when the client negotiates a newer protocol
+        self.encoder = JsonFrameEncoder()
+
+    def touch(self):
+        """Record client activity so the reaper leaves this connection alone"""
+        self.last_activity = time.monotonic()
+
+    def is_idle(self, now: float) -> bool:
+        return not self.streaming and now - self.last_activity > WS_IDLE_TIMEOUT
+
+
+class ConnectionManager:
+    """Registry of open WebSocket connections for this worker"""
+
+    def __init__(self):
+        self.active_connections: Dict[str, Connection] = {}
+        self.connections_per_ip: Dict[str, int] = {}
+        self._reaper_task: Optional[asyncio.Task] = None
+        # Set while the worker shuts down; no new sockets are accepted
+        self.draining = False
+
+    async def connect(self, websocket: WebSocket, client_id: str) -> Optional[Connection]:
+        """Accept a WebSocket, or reject it with 1013 when a cap is reached"""
+        client_ip = websocket.client.host if websocket.client else "unknown"
+
+        if self.draining:
+            await websocket.close(code=CLOSE_TRY_AGAIN_LATER)
+            return None
+        if len(self.active_connections) >= WS_MAX_CONNECTIONS:
+            logger.warning(f"Rejecting WebSocket from {client_ip}: worker limit of {WS_MAX_CONNECTIONS} reached")
+            await websocket.close(code=CLOSE_TRY_AGAIN_LATER)
+            return None
+        if self.connections_per_ip.get(client_ip, 0) >= WS_MAX_CONNECTIONS_PER_IP:
+            logger.warning(f"Rejecting WebSocket from {client_ip}: per-IP limit of {WS_MAX_CONNECTIONS_PER_IP} reached")
+            await websocket.close(code=CLOSE_TRY_AGAIN_LATER)
+            return None
+
+        await websocket.accept()
+        connection = Connection(websocket, client_id, client_ip)
+        self.active_connections[connection.id] = connection
+        self.connections_per_ip[client_ip] = self.connections_per_ip.get(client_ip, 0) + 1
+        self._ensure_reaper()
+        return connection
+
+    def disconnect(self, connection: Connection):
+        """Forget a connection; safe to call more than once"""
+        if self.active_connections.pop(connection.id, None) is None:
+            return
+        remaining = self.connections_per_ip.get(connection.client_ip, 1) - 1
+        if remaining > 0:
+            self.connections_per_ip[connection.client_ip] = remaining
+        else:
+            self.connections_per_ip.pop(connection.client_ip, None)
+
+    async def close(self, connection: Connection, code: int = 1000):
+        """Close the socket (if still open) and drop it from the registry"""
+        self.disconnect(connection)
+        if connection.websocket.application_state == WebSocketState.CONNECTED:
+            try:
+                await connection.websocket.close(code=code)
+            except Exception as e:
+                logger.debug(f"Error closing WebSocket {connection.id}: {e}")
+
+    async def send_message(self, message: str, connection: Connection):
+        if connection.id in self.active_connections:
+            await connection.websocket.send_text(message)
+
+    async def send_frames(self, frames: Iterable[Frame], connection: Connection):
+        """Send encoded frames, as binary or text frames depending on their type"""
+        if connection.id not in self.active_connections:
+            return
+        for frame in frames:
+            if isinstance(frame, bytes):
+                await connection.websocket.send_bytes(frame)
+            else:
+                await connection.websocket.send_text(frame)
+
+    async def broadcast(self, message: str):
+        for connection in list(self.active_connections.values()):
+            try:
+                await connection.websocket.send_text(message)
+            except Exception:
+                await self.close(connection)
+
+    def _ensure_reaper(self):
+        if self._reaper_task is None or self._reaper_task.done():
+            self._reaper_task = asyncio.get_running_loop().create_task(self._reap_idle())
+
+    async def _reap_idle(self):
+        """Periodically close idle connections; exits when the registry is empty"""
+        while self.active_connections:
+            await asyncio.sleep(WS_REAP_INTERVAL)
+            now = time.monotonic()
+            idle = [c for c in self.active_connections.values() if c.is_idle(now)]
+            for connection in idle:
+                logger.info(f"Closing idle WebSocket {connection.id} from {connection.client_ip}")
+                await self.close(connection, code=CLOSE_GOING_AWAY)
+
+    def status(self) -> Dict[str, int]:
+        return {
+            "websockets": len(self.active_connections),
+            "streaming": sum(1 for c in self.active_connections.values() if c.streaming),
+        }
+
+    async def drain(self, timeout: float):
+        """
+        Let answers that are streaming finish (up to timeout seconds), closing each
+        socket with 1001 as soon as it is idle so the client reconnects elsewhere.
+        """
+        self.draining = True
+        deadline = time.monotonic() + timeout
+        logger.info(f"Draining {len(self.active_connections)} WebSocket(s), "
+                    f"{self.status()['streaming']} streaming")
+        while self.active_connections:
+            for connection in [c for c in self.active_connections.values() if not c.streaming]:
+                await self.close(connection, code=CLOSE_GOING_AWAY)
+            if not self.active_connections or time.monotonic() >= deadline:
+                break
+            await asyncio.sleep(0.1)
+        for connection in list(self.active_connections.values()):
+            logger.warning(f"Closing WebSocket {connection.id} mid-answer: drain timeout of {timeout}s exceeded")
+            await self.close(connection, code=CLOSE_GOING_AWAY)
@@ -1,12 +1,16 @@
 import os
 import json
+import hashlib
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterator, Tuple
 from pathlib import Path
 from dotenv import load_dotenv
+import threading
 import psycopg2
-from psycopg2.extras import RealDictCursor, Json
+from psycopg2.extras import RealDictCursor, Json, execute_values
+from psycopg2.pool import ThreadedConnectionPool
 from contextlib import contextmanager
+import search_index
 
 # Load environment variables
 load_dotenv()
@@ -21,6 +25,12 @@ DB_PORT = os.getenv("POSTGRES_PORT", "5432")
 DB_NAME = os.getenv("POSTGRES_DB", "chatbot_db")
 DB_USER = os.getenv("POSTGRES_USER", "postgres")
 DB_PASS = os.getenv("POSTGRES_PASSWORD", "postgres")
+# Fail fast on an unreachable server instead of waiting for the TCP timeout
+DB_CONNECT_TIMEOUT = int(os.getenv("POSTGRES_CONNECT_TIMEOUT", "5"))
+# Connection pool opened by the application at startup (scripts connect per call);
+# psycopg2 keeps at most DB_POOL_MIN idle connections and closes the rest when returned
+DB_POOL_MIN = int(os.getenv("POSTGRES_POOL_MIN", "5"))
+DB_POOL_MAX = int(os.getenv("POSTGRES_POOL_MAX", "20"))
 
 # Local storage path as fallback
 LOCAL_STORAGE_DIR = Path("local_storage")
@@ -30,24 +40,79 @@ LOCAL_STORAGE_FILE = LOCAL_STORAGE_DIR / "chatbots.json"
 # Flag to indicate if we're using PostgreSQL or local storage
 using_postgres = False
 
+# Pool state; the semaphore makes callers wait for a free connection instead of failing
+pool_enabled = False
+_pool = None
+_pool_slots = None
+_pool_lock = threading.Lock()
+
+def connect():
+    """Open a new PostgreSQL connection"""
+    return psycopg2.connect(
+        host=DB_HOST,
+        port=DB_PORT,
+        dbname=DB_NAME,
+        user=DB_USER,
+        password=DB_PASS,
+        connect_timeout=DB_CONNECT_TIMEOUT
+    )
+
+def open_pool() -> bool:
+    """
+    Initialize the database and pool connections from now on; returns whether PostgreSQL is used.
+    If PostgreSQL is down the pool is created by the first init_db() that reaches it.
+    """
+    global pool_enabled
+    pool_enabled = True
+    return init_db()
+
+def create_pool():
+    global _pool, _pool_slots
+    with _pool_lock:
+        if _pool is not None:
+            return
+        _pool_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+        _pool = ThreadedConnectionPool(
+            DB_POOL_MIN, DB_POOL_MAX,
+            host=DB_HOST, port=DB_PORT, dbname=DB_NAME, user=DB_USER, password=DB_PASS,
+            connect_timeout=DB_CONNECT_TIMEOUT
+        )
+        logger.info(f"Opened PostgreSQL connection pool ({DB_POOL_MIN}-{DB_POOL_MAX} connections)")
+
+def close_pool():
+    """Close every pooled connection"""
+    global _pool
+    if _pool is not None:
+        _pool.closeall()
+        _pool = None
+
 @contextmanager
 def get_db_connection():
-    """Context manager for database connections"""
+    """Context manager for database connections, borrowed from the pool when one is open"""
+    pool, slots = _pool, _pool_slots
     conn = None
+    broken = False
+    if pool is not None:
+        slots.acquire()
     try:
-        conn = psycopg2.connect(
-            host=DB_HOST,
-            port=DB_PORT,
-            dbname=DB_NAME,
-            user=DB_USER,
-            password=DB_PASS
-        )
+        conn = pool.getconn() if pool is not None else connect()
         yield conn
     except Exception as e:
+        # A dropped server connection must not go back into the pool
+        broken = isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError))
         logger.error(f"Database connection error: {e}")
         raise
     finally:
-        if conn is not None:
+        if pool is not None:
+            try:
+                if conn is not None:
+                    if conn.autocommit and not conn.closed:
+                        conn.autocommit = False
+                    # putconn rolls back anything left open
+                    pool.putconn(conn, close=broken or bool(conn.closed))
+            finally:
+                slots.release()
+        elif conn is not None:
             conn.close()
 
 def init_db():
@@ -57,32 +122,38 @@ def init_db():
         # Try to connect to PostgreSQL
         with get_db_connection() as conn:
             with conn.cursor() as cur:
-                # Create chatbots table if it doesn't exist
+                # Create chatbots table if it doesn't exist; the JSONB document is the only copy of the fields
                 cur.execute("""
                     CREATE TABLE IF NOT EXISTS chatbots (
-                        id VARCHAR(255),
                         unique_id VARCHAR(255) PRIMARY KEY,
-                        name VARCHAR(255) NOT NULL,
-                        chat_logo_color VARCHAR(50) NOT NULL,
-                        chat_logo_image TEXT,
-                        icon_avatar_image TEXT,
-                        static_image TEXT,
-                        chat_header_color VARCHAR(50) NOT NULL,
-                        chat_bg_gradient_start VARCHAR(50) NOT NULL,
-                        chat_bg_gradient_end VARCHAR(50) NOT NULL,
-                        body_background_image TEXT,
-                        welcome_text TEXT NOT NULL,
-                        api_key VARCHAR(255) NOT NULL,
-                        analytics_url TEXT,
-                        data JSONB
+                        data JSONB NOT NULL,
+                        version INTEGER NOT NULL DEFAULT 1
                     )
                 """)
-                # Create index for faster queries
-                cur.execute("CREATE INDEX IF NOT EXISTS idx_chatbots_id ON chatbots (id)")
+                # Row version for optimistic concurrency (added to tables created before it existed)
+                cur.execute("ALTER TABLE chatbots ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1")
+                cur.execute("""
+                    SELECT column_name, is_nullable FROM information_schema.columns
+                    WHERE table_schema = current_schema() AND table_name = 'chatbots'
+                """)
+                legacy = {name: nullable for name, nullable in cur.fetchall() if name in LEGACY_COLUMNS.values()}
+                if legacy:
+                    # Old layout: stop requiring the duplicated columns so lean writes succeed until
+                    # migrate_row_layout.py drops them (DROP NOT NULL only touches the catalog)
+                    for column, nullable in legacy.items():
+                        if nullable == "NO":
+                            cur.execute(f"ALTER TABLE chatbots ALTER COLUMN {column} DROP NOT NULL")
+                    logger.warning("chatbots table still has the duplicated column layout; run migrate_row_layout.py")
+                else:
+                    # Expression index for lookups by id, read straight from the document
+                    cur.execute("CREATE INDEX IF NOT EXISTS idx_chatbots_data_id ON chatbots ((data->>'id'))")
+                    create_search_indexes(cur)
                 conn.commit()
         
         logger.info(f"Connected to PostgreSQL database: {DB_NAME} on {DB_HOST}")
         using_postgres = True
+        if pool_enabled:
+            create_pool()
         return True
     except Exception as e:
         logger.error(f"Error initializing PostgreSQL database: {e}")
@@ -94,61 +165,57 @@ def init_db():
                 json.dump({"chatbots": []}, f)
         return False
 
-def convert_to_pg_format(chatbot_data):
-    """Convert chatbot data to PostgreSQL format"""
-    # Extract specific fields for the structured columns
-    structured_fields = {
-        "id": chatbot_data.get("id", ""),
+# Whether pg_trgm is installed, so substring search can use trigram indexes
+search_trigram = False
+
+def create_search_indexes(cur):
+    """Indexes behind search_chatbots: a prefix btree on name, and trigram GIN indexes when pg_trgm exists"""
+    global search_trigram
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_chatbots_name_prefix ON chatbots (lower(data->>'name') text_pattern_ops)")
+    cur.execute("SAVEPOINT search_trigram")
+    try:
+        cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_chatbots_name_trgm ON chatbots USING gin (lower(data->>'name') gin_trgm_ops)")
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_chatbots_welcome_text_trgm
+            ON chatbots USING gin (lower(data->>'welcomeText') gin_trgm_ops)
+        """)
+        cur.execute("RELEASE SAVEPOINT search_trigram")
+        search_trigram = True
+    except psycopg2.Error as e:
+        # Substring search still works without the extension, as a sequential scan
+        cur.execute("ROLLBACK TO SAVEPOINT search_trigram")
+        logger.warning(f"pg_trgm unavailable, substring search will not be indexed: {str(e).splitlines()[0]}")
+        search_trigram = False
+
+# Typed column for each API field in the original layout, which duplicated the JSONB document
+LEGACY_COLUMNS = {
+    "id": "id",
+    "name": "name",
+    "chatLogoColor": "chat_logo_color",
+    "chatLogoImage": "chat_logo_image",
+    "iconAvatarImage": "icon_avatar_image",
+    "staticImage": "static_image",
+    "chatHeaderColor": "chat_header_color",
+    "chatBgGradientStart": "chat_bg_gradient_start",
+    "chatBgGradientEnd": "chat_bg_gradient_end",
+    "bodyBackgroundImage": "body_background_image",
+    "welcomeText": "welcome_text",
+    "apiKey": "api_key",
+    "analyticsUrl": "analytics_url",
+}
+
+def convert_to_pg_format(chatbot_data, data_json: Optional[str] = None):
+    """Convert chatbot data to PostgreSQL format; data_json is the document already serialized by the caller"""
+    # The key column plus the full document; every other field lives only in data
+    return {
         "unique_id": chatbot_data.get("uniqueId", ""),
-        "name": chatbot_data.get("name", ""),
-        "chat_logo_color": chatbot_data.get("chatLogoColor", "#000000"),
-        "chat_logo_image": chatbot_data.get("chatLogoImage", None),
-        "icon_avatar_image": chatbot_data.get("iconAvatarImage", None),
-        "static_image": chatbot_data.get("staticImage", None),
-        "chat_header_color": chatbot_data.get("chatHeaderColor", "#000000"),
-        "chat_bg_gradient_start": chatbot_data.get("chatBgGradientStart", "#ffffff"),
-        "chat_bg_gradient_end": chatbot_data.get("chatBgGradientEnd", "#ffffff"),
-        "body_background_image": chatbot_data.get("bodyBackgroundImage", None),
-        "welcome_text": chatbot_data.get("welcomeText", "Welcome!"),
-        "api_key": chatbot_data.get("apiKey", ""),
-        "analytics_url": chatbot_data.get("analyticsUrl", None),
-        # Store the full data object as JSONB for future extensibility
-        "data": Json(chatbot_data)
+        "data": data_json if data_json is not None else Json(chatbot_data)
     }
-    return structured_fields
 
 def convert_from_pg_format(db_record):
     """Convert PostgreSQL record to the format expected by the API"""
-    # If we have a full JSON data field, use it as the base
-    if db_record.get("data"):
-        chatbot = db_record["data"]
-    else:
-        # Otherwise build the object from the structured fields
-        chatbot = {
-            "id": db_record.get("id", ""),
-            "uniqueId": db_record.get("unique_id", ""),
-            "name": db_record.get("name", ""),
-            "chatLogoColor": db_record.get("chat_logo_color", "#000000"),
-            "chatHeaderColor": db_record.get("chat_header_color", "#000000"),
-            "chatBgGradientStart": db_record.get("chat_bg_gradient_start", "#ffffff"),
-            "chatBgGradientEnd": db_record.get("chat_bg_gradient_end", "#ffffff"),
-            "welcomeText": db_record.get("welcome_text", "Welcome!"),
-            "apiKey": db_record.get("api_key", "")
-        }
-        
-        # Add optional fields if they exist
-        if db_record.get("chat_logo_image"):
-            chatbot["chatLogoImage"] = db_record["chat_logo_image"]
-        if db_record.get("icon_avatar_image"):
-            chatbot["iconAvatarImage"] = db_record["icon_avatar_image"]
-        if db_record.get("static_image"):
-            chatbot["staticImage"] = db_record["static_image"]
-        if db_record.get("body_background_image"):
-            chatbot["bodyBackgroundImage"] = db_record["body_background_image"]
-        if db_record.get("analytics_url"):
-            chatbot["analyticsUrl"] = db_record["analytics_url"]
-    
-    return chatbot
+    return db_record["data"]
 
 def get_all_chatbots() -> List[Dict[str, Any]]:
     """Get all chatbots from the database or local storage"""
@@ -160,7 +227,7 @@ def get_all_chatbots() -> List[Dict[str, Any]]:
         if using_postgres:
             with get_db_connection() as conn:
                 with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                    cur.execute("SELECT * FROM chatbots")
+                    cur.execute("SELECT data FROM chatbots")
                     db_chatbots = cur.fetchall()
                     
                     # Convert database records to API format
@@ -197,8 +264,78 @@ def get_all_chatbots() -> List[Dict[str, Any]]:
                 logger.error(f"Error getting chatbots from local storage: {local_error}")
         return []
 
-def get_chatbot_by_unique_id(unique_id: str) -> Optional[Dict[str, Any]]:
-    """Get a chatbot by its unique ID from the database or local storage"""
+def escape_like(text: str) -> str:
+    """Escape LIKE wildcards so user input only matches literally"""
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def load_local_chatbots() -> List[Dict[str, Any]]:
+    with open(LOCAL_STORAGE_FILE, 'r') as f:
+        return json.load(f).get("chatbots", [])
+
+def search_chatbots(query: str, prefix: bool = False, limit: int = 20,
+                    offset: int = 0) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    Case-insensitive search over name and welcome text, returning one page and whether more follow.
+
+    Name prefix matches rank first, then name substring matches, then welcome text
+    matches; ties are ordered by name and uniqueId. With prefix=True only name
+    prefixes match (typeahead).
+    """
+    try:
+        # Always try to connect to PostgreSQL first, even if we previously used local storage
+        if not using_postgres:
+            init_db()  # Try to initialize PostgreSQL connection again
+        
+        if using_postgres:
+            params = {
+                "prefix": escape_like(query.lower()) + "%",
+                "contains": "%" + escape_like(query.lower()) + "%",
+                "limit": limit + 1,
+                "offset": offset
+            }
+            if prefix:
+                condition = "lower(data->>'name') LIKE %(prefix)s"
+            else:
+                condition = "(lower(data->>'name') LIKE %(contains)s OR lower(data->>'welcomeText') LIKE %(contains)s)"
+            with get_db_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(f"""
+                        SELECT data FROM chatbots
+                        WHERE {condition}
+                        ORDER BY CASE
+                                     WHEN lower(data->>'name') LIKE %(prefix)s THEN 3
+                                     WHEN lower(data->>'name') LIKE %(contains)s THEN 2
+                                     ELSE 1
+                                 END DESC,
+                                 lower(data->>'name') COLLATE "C", unique_id COLLATE "C"
+                        LIMIT %(limit)s OFFSET %(offset)s
+                    """, params)
+                    chatbots = [row[0] for row in cur.fetchall()]
+                    logger.info(f"Search for {query!r} returned {min(len(chatbots), limit)} chatbots from PostgreSQL")
+                    return chatbots[:limit], len(chatbots) > limit
+        else:
+            index = search_index.get_index(LOCAL_STORAGE_FILE, load_local_chatbots)
+            return index.search(query, prefix=prefix, limit=limit, offset=offset)
+    except Exception as e:
+        logger.error(f"Error searching chatbots: {e}")
+        logger.error(f"Storage type: {'PostgreSQL' if using_postgres else 'Local Storage'}")
+        
+        # If PostgreSQL fails, try local storage as a last resort
+        if using_postgres:
+            logger.info("PostgreSQL failed, trying local storage as fallback for search...")
+            try:
+                index = search_index.get_index(LOCAL_STORAGE_FILE, load_local_chatbots)
+                return index.search(query, prefix=prefix, limit=limit, offset=offset)
+            except Exception as local_error:
+                logger.error(f"Error searching chatbots in local storage: {local_error}")
+        return [], False
+
+def local_version(chatbot: Dict[str, Any]) -> str:
+    """Version token for a local-storage chatbot: a hash of its content"""
+    return "h-" + hashlib.md5(json.dumps(chatbot, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+def get_chatbot_with_version(unique_id: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """Get a chatbot and its version token from the database or local storage"""
     try:
         # Always try to connect to PostgreSQL first, even if we previously used local storage
         if not using_postgres:
@@ -207,16 +344,16 @@ def get_chatbot_by_unique_id(unique_id: str) -> Optional[Dict[str, Any]]:
         if using_postgres:
             with get_db_connection() as conn:
                 with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                    cur.execute("SELECT * FROM chatbots WHERE unique_id = %s", (unique_id,))
+                    cur.execute("SELECT data, version FROM chatbots WHERE unique_id = %s", (unique_id,))
                     record = cur.fetchone()
                     
                     if record:
                         chatbot = convert_from_pg_format(record)
                         logger.info(f"Retrieved chatbot from PostgreSQL with ID: {unique_id}")
-                        return chatbot
+                        return chatbot, str(record["version"])
                     else:
                         logger.warning(f"Chatbot with ID {unique_id} not found in PostgreSQL")
-                        return None
+                        return None, None
         else:
             # Load from local storage
             if LOCAL_STORAGE_FILE.exists():
@@ -225,9 +362,9 @@ def get_chatbot_by_unique_id(unique_id: str) -> Optional[Dict[str, Any]]:
                     for chatbot in data.get("chatbots", []):
                         if chatbot.get("uniqueId") == unique_id:
                             logger.info(f"Retrieved chatbot from local storage with ID: {unique_id}")
-                            return chatbot
+                            return chatbot, local_version(chatbot)
             logger.warning(f"Chatbot with ID {unique_id} not found in local storage")
-            return None
+            return None, None
     except Exception as e:
         logger.error(f"Error getting chatbot by unique ID: {e}")
         logger.error(f"Storage type: {'PostgreSQL' if using_postgres else 'Local Storage'}")
@@ -243,14 +380,47 @@ def get_chatbot_by_unique_id(unique_id: str) -> Optional[Dict[str, Any]]:
                         for chatbot in data.get("chatbots", []):
                             if chatbot.get("uniqueId") == unique_id:
                                 logger.info(f"Retrieved chatbot from local storage (after PostgreSQL failure) with ID: {unique_id}")
-                                return chatbot
+                                return chatbot, local_version(chatbot)
                 logger.warning(f"Chatbot with ID {unique_id} not found in local storage during fallback")
             except Exception as local_error:
                 logger.error(f"Error getting chatbot from local storage: {local_error}")
-        return None
+        return None, None
+
+def get_chatbot_by_unique_id(unique_id: str) -> Optional[Dict[str, Any]]:
+    """Get a chatbot by its unique ID from the database or local storage"""
+    chatbot, _ = get_chatbot_with_version(unique_id)
+    return chatbot
+
+def get_chatbot_json(unique_id: str) -> Tuple[Optional[str], Optional[str]]:
+    """Get a chatbot as JSON text plus its version, without decoding the JSONB in Python"""
+    try:
+        # Always try to connect to PostgreSQL first, even if we previously used local storage
+        if not using_postgres:
+            init_db()  # Try to initialize PostgreSQL connection again
+        
+        if using_postgres:
+            with get_db_connection() as conn:
+                with conn.cursor() as cur:
+                    # data::text arrives as a plain string, so psycopg2 never builds a dict
+                    cur.execute("SELECT data::text, version FROM chatbots WHERE unique_id = %s", (unique_id,))
+                    record = cur.fetchone()
+                    if record is None:
+                        logger.warning(f"Chatbot with ID {unique_id} not found in PostgreSQL")
+                        return None, None
+                    logger.info(f"Retrieved chatbot from PostgreSQL with ID: {unique_id}")
+                    return record[0], str(record[1])
+    except Exception as e:
+        logger.error(f"Error getting chatbot JSON by unique ID: {e}")
+    
+    # Local storage (or a failed PostgreSQL read) goes through the regular path
+    chatbot, version = get_chatbot_with_version(unique_id)
+    return (json.dumps(chatbot), version) if chatbot else (None, None)
 
-def create_chatbot(chatbot_data: Dict[str, Any]) -> bool:
-    """Create a new chatbot in the database or local storage"""
+def create_chatbot(chatbot_data: Dict[str, Any], data_json: Optional[str] = None) -> bool:
+    """
+    Create a new chatbot in the database or local storage.
+    Pass data_json (e.g. from model_dump_json) to store the document without serializing it again.
+    """
     try:
         # Always try to connect to PostgreSQL first, even if we previously used local storage
         if not using_postgres:
@@ -258,25 +428,14 @@ def create_chatbot(chatbot_data: Dict[str, Any]) -> bool:
         
         if using_postgres:
             # Convert chatbot data to PostgreSQL format
-            pg_data = convert_to_pg_format(chatbot_data)
+            pg_data = convert_to_pg_format(chatbot_data, data_json)
             
             with get_db_connection() as conn:
                 with conn.cursor() as cur:
                     # Insert into PostgreSQL using named parameters
                     cur.execute("""
-                        INSERT INTO chatbots (
-                            id, unique_id, name, chat_logo_color, chat_logo_image, 
-                            icon_avatar_image, static_image, chat_header_color,
-                            chat_bg_gradient_start, chat_bg_gradient_end, 
-                            body_background_image, welcome_text, api_key, 
-                            analytics_url, data
-                        ) VALUES (
-                            %(id)s, %(unique_id)s, %(name)s, %(chat_logo_color)s, %(chat_logo_image)s,
-                            %(icon_avatar_image)s, %(static_image)s, %(chat_header_color)s,
-                            %(chat_bg_gradient_start)s, %(chat_bg_gradient_end)s,
-                            %(body_background_image)s, %(welcome_text)s, %(api_key)s,
-                            %(analytics_url)s, %(data)s
-                        )
+                        INSERT INTO chatbots (unique_id, data)
+                        VALUES (%(unique_id)s, %(data)s::jsonb)
                     """, pg_data)
                     conn.commit()
                     
@@ -327,85 +486,58 @@ def create_chatbot(chatbot_data: Dict[str, Any]) -> bool:
                 logger.error(f"Error creating chatbot in local storage: {local_error}")
         return False
 
-def update_chatbot(unique_id: str, chatbot_data: Dict[str, Any]) -> bool:
-    """Update an existing chatbot in the database or local storage"""
+def patch_chatbot(unique_id: str, changes: Dict[str, Any], expected_version: Optional[str] = None,
+                  changes_json: Optional[str] = None) -> Tuple[str, Optional[str], Optional[str]]:
+    """
+    Merge changes into a chatbot in a single UPDATE ... RETURNING statement.
+
+    If expected_version is given the update only applies while the stored version
+    still matches. changes_json, when given, is changes already serialized by the
+    caller. Returns (status, chatbot JSON text, version) with status one of
+    "ok", "not_found", "conflict" or "error".
+    """
     try:
         # Always try to connect to PostgreSQL first, even if we previously used local storage
         if not using_postgres:
             init_db()  # Try to initialize PostgreSQL connection again
         
         if using_postgres:
-            # Get existing chatbot to update with new data
+            # Merge into the JSONB document; only the key column is kept alongside it
+            assignments = ["data = data || %(changes)s::jsonb", "version = version + 1"]
+            params = {"changes": changes_json if changes_json is not None else Json(changes),
+                      "target_unique_id": unique_id}
+            if "uniqueId" in changes:
+                assignments.append("unique_id = %(unique_id)s")
+                params["unique_id"] = changes["uniqueId"]
+            query = f"UPDATE chatbots SET {', '.join(assignments)} WHERE unique_id = %(target_unique_id)s"
+            if expected_version is not None:
+                if not expected_version.isdigit():
+                    return "conflict", None, None
+                query += " AND version = %(expected_version)s"
+                params["expected_version"] = int(expected_version)
+            query += " RETURNING data::text, version"
+            
             with get_db_connection() as conn:
-                with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                    cur.execute("SELECT * FROM chatbots WHERE unique_id = %s", (unique_id,))
-                    existing = cur.fetchone()
-                    
-                    if not existing:
-                        logger.error(f"Chatbot with ID {unique_id} not found in PostgreSQL")
-                        return False
-                    
-                    # Get the existing data and update it with new values
-                    existing_data = existing.get("data", {})
-                    if existing_data:
-                        # Update the JSON with new values
-                        for key, value in chatbot_data.items():
-                            existing_data[key] = value
-                    else:
-                        # Use the new data directly
-                        existing_data = chatbot_data
-                    
-                    # Prepare the updated PostgreSQL data
-                    pg_data = convert_to_pg_format(existing_data)
-                    pg_data["original_unique_id"] = unique_id  # For the WHERE clause
-                    
-                    # Update the record
-                    cur.execute("""
-                        UPDATE chatbots SET
-                            id = %(id)s,
-                            unique_id = %(unique_id)s,
-                            name = %(name)s,
-                            chat_logo_color = %(chat_logo_color)s,
-                            chat_logo_image = %(chat_logo_image)s,
-                            icon_avatar_image = %(icon_avatar_image)s,
-                            static_image = %(static_image)s,
-                            chat_header_color = %(chat_header_color)s,
-                            chat_bg_gradient_start = %(chat_bg_gradient_start)s,
-                            chat_bg_gradient_end = %(chat_bg_gradient_end)s,
-                            body_background_image = %(body_background_image)s,
-                            welcome_text = %(welcome_text)s,
-                            api_key = %(api_key)s,
-                            analytics_url = %(analytics_url)s,
-                            data = %(data)s
-                        WHERE unique_id = %(original_unique_id)s
-                    """, pg_data)
+                with conn.cursor() as cur:
+                    cur.execute(query, params)
+                    row = cur.fetchone()
+                    if row is None:
+                        if expected_version is None:
+                            logger.warning(f"Chatbot with ID {unique_id} not found in PostgreSQL")
+                            return "not_found", None, None
+                        # Only on the failure path: tell a stale version from a missing row
+                        cur.execute("SELECT 1 FROM chatbots WHERE unique_id = %s", (unique_id,))
+                        if cur.fetchone() is None:
+                            return "not_found", None, None
+                        logger.info(f"Version conflict updating chatbot with ID: {unique_id}")
+                        return "conflict", None, None
                     conn.commit()
                     
                     logger.info(f"Updated chatbot in PostgreSQL with ID: {unique_id}")
-                    return True
+                    return "ok", row[0], str(row[1])
         else:
-            # MongoDB unavailable, fall back to local storage
-            # Load existing chatbots
-            if LOCAL_STORAGE_FILE.exists():
-                with open(LOCAL_STORAGE_FILE, 'r') as f:
-                    data = json.load(f)
-                    chatbots = data.get("chatbots", [])
-                
-                # Find and update the chatbot
-                for i, chatbot in enumerate(chatbots):
-                    if chatbot.get("uniqueId") == unique_id:
-                        # Update the chatbot with new data
-                        chatbots[i].update(chatbot_data)
-                        
-                        # Save back to file
-                        with open(LOCAL_STORAGE_FILE, 'w') as f:
-                            json.dump({"chatbots": chatbots}, f, indent=2)
-                        
-                        logger.info(f"Updated chatbot in local storage with ID: {unique_id}")
-                        return True
-            
-            logger.error(f"Chatbot with ID {unique_id} not found in local storage")
-            return False
+            # PostgreSQL unavailable, fall back to local storage
+            return patch_local_chatbot(unique_id, changes, expected_version)
     except Exception as e:
         logger.error(f"Error updating chatbot: {e}")
         logger.error(f"Storage type: {'PostgreSQL' if using_postgres else 'Local Storage'}")
@@ -414,29 +546,40 @@ def update_chatbot(unique_id: str, chatbot_data: Dict[str, Any]) -> bool:
         if using_postgres:
             logger.info("PostgreSQL failed, trying local storage as fallback...")
             try:
-                # Load existing chatbots
-                if LOCAL_STORAGE_FILE.exists():
-                    with open(LOCAL_STORAGE_FILE, 'r') as f:
-                        data = json.load(f)
-                        chatbots = data.get("chatbots", [])
-                    
-                    # Find and update the chatbot
-                    for i, chatbot in enumerate(chatbots):
-                        if chatbot.get("uniqueId") == unique_id:
-                            # Update the chatbot with new data
-                            chatbots[i].update(chatbot_data)
-                            
-                            # Save back to file
-                            with open(LOCAL_STORAGE_FILE, 'w') as f:
-                                json.dump({"chatbots": chatbots}, f, indent=2)
-                            
-                            logger.info(f"Updated chatbot in local storage (after PostgreSQL failure) with ID: {unique_id}")
-                            return True
-                            
-                logger.error(f"Chatbot with ID {unique_id} not found in local storage during fallback")
+                return patch_local_chatbot(unique_id, changes, expected_version)
             except Exception as local_error:
                 logger.error(f"Error updating chatbot in local storage: {local_error}")
-        return False
+        return "error", None, None
+
+def patch_local_chatbot(unique_id: str, changes: Dict[str, Any],
+                        expected_version: Optional[str] = None) -> Tuple[str, Optional[str], Optional[str]]:
+    """Local storage counterpart of patch_chatbot, versioned by content hash"""
+    if LOCAL_STORAGE_FILE.exists():
+        with open(LOCAL_STORAGE_FILE, 'r') as f:
+            data = json.load(f)
+            chatbots = data.get("chatbots", [])
+        
+        # Find and update the chatbot
+        for chatbot in chatbots:
+            if chatbot.get("uniqueId") == unique_id:
+                if expected_version is not None and local_version(chatbot) != expected_version:
+                    return "conflict", None, None
+                chatbot.update(changes)
+                
+                # Save back to file
+                with open(LOCAL_STORAGE_FILE, 'w') as f:
+                    json.dump({"chatbots": chatbots}, f, indent=2)
+                
+                logger.info(f"Updated chatbot in local storage with ID: {unique_id}")
+                return "ok", json.dumps(chatbot), local_version(chatbot)
+    
+    logger.error(f"Chatbot with ID {unique_id} not found in local storage")
+    return "not_found", None, None
+
+def update_chatbot(unique_id: str, chatbot_data: Dict[str, Any]) -> bool:
+    """Update an existing chatbot in the database or local storage"""
+    status, _, _ = patch_chatbot(unique_id, chatbot_data)
+    return status == "ok"
 
 def delete_chatbot(unique_id: str) -> bool:
     """Delete a chatbot from the database or local storage"""
@@ -512,6 +655,167 @@ def delete_chatbot(unique_id: str) -> bool:
                 logger.error(f"Error deleting chatbot from local storage: {local_error}")
         return False
 
+class BulkWriter:
+    """
+    Writes chatbots in batched multi-row INSERTs inside a single transaction.
+
+    Each batch runs under a savepoint; if a batch fails it is retried row by row so
+    the failing rows can be reported individually. Without PostgreSQL the rows are
+    applied to local storage in memory and the file is written once on commit.
+    """
+
+    def __init__(self, upsert: bool = False):
+        self.upsert = upsert
+        self.conn = None
+        self.local_chatbots = None
+        self.local_index = None
+
+    def open(self):
+        """Open the connection (or load local storage) for the whole import"""
+        if not using_postgres:
+            init_db()  # Try to initialize PostgreSQL connection again
+
+        if using_postgres:
+            self.conn = connect()
+        else:
+            self.local_chatbots = []
+            if LOCAL_STORAGE_FILE.exists():
+                with open(LOCAL_STORAGE_FILE, 'r') as f:
+                    self.local_chatbots = json.load(f).get("chatbots", [])
+            self.local_index = {bot.get("uniqueId"): i for i, bot in enumerate(self.local_chatbots)}
+
+    def write_batch(self, batch: List[Tuple[int, Dict[str, Any]]]) -> Tuple[Dict[str, int], List[Dict[str, Any]]]:
+        """Write (line number, chatbot) pairs; returns counts and per-row errors"""
+        if self.conn is None:
+            return self._write_local(batch)
+
+        counts = {"created": 0, "updated": 0}
+        errors = []
+        outcomes = {}  # line number -> True if inserted, False if updated
+        with self.conn.cursor() as cur:
+            cur.execute("SAVEPOINT bulk_batch")
+            try:
+                written = dict(self._insert(cur, [chatbot for _, chatbot in batch]))
+                cur.execute("RELEASE SAVEPOINT bulk_batch")
+                for line, chatbot in batch:
+                    if chatbot.get("uniqueId") in written:
+                        outcomes[line] = written.pop(chatbot.get("uniqueId"))
+            except psycopg2.Error as e:
+                logger.warning(f"Bulk batch failed ({e.__class__.__name__}), retrying row by row")
+                cur.execute("ROLLBACK TO SAVEPOINT bulk_batch")
+                for line, chatbot in batch:
+                    cur.execute("SAVEPOINT bulk_row")
+                    try:
+                        written = self._insert(cur, [chatbot])
+                        cur.execute("RELEASE SAVEPOINT bulk_row")
+                        if written:
+                            outcomes[line] = written[0][1]
+                    except psycopg2.Error as row_error:
+                        cur.execute("ROLLBACK TO SAVEPOINT bulk_row")
+                        errors.append({"line": line, "uniqueId": chatbot.get("uniqueId"),
+                                       "error": str(row_error).strip()})
+
+        failed = {error["line"] for error in errors}
+        for line, chatbot in batch:
+            if line in outcomes:
+                counts["created" if outcomes[line] else "updated"] += 1
+            elif line not in failed:
+                errors.append({"line": line, "uniqueId": chatbot.get("uniqueId"),
+                               "error": "Chatbot with this uniqueId already exists"})
+        return counts, errors
+
+    def _insert(self, cur, chatbots: List[Dict[str, Any]]) -> List[Tuple[str, bool]]:
+        """Multi-row INSERT returning (uniqueId, inserted) for every row written"""
+        rows = [convert_to_pg_format(chatbot) for chatbot in chatbots]
+        columns = list(rows[0].keys())
+        if self.upsert:
+            conflict = "DO UPDATE SET " + ", ".join(
+                [f"{c} = EXCLUDED.{c}" for c in columns if c != "unique_id"] + ["version = chatbots.version + 1"]
+            )
+        else:
+            conflict = "DO NOTHING"
+        return execute_values(
+            cur,
+            f"""
+                INSERT INTO chatbots ({', '.join(columns)}) VALUES %s
+                ON CONFLICT (unique_id) {conflict}
+                RETURNING unique_id, (xmax = 0) AS inserted
+            """,
+            [tuple(row[c] for c in columns) for row in rows],
+            page_size=len(rows),
+            fetch=True
+        )
+
+    def _write_local(self, batch):
+        counts = {"created": 0, "updated": 0}
+        errors = []
+        for line, chatbot in batch:
+            position = self.local_index.get(chatbot.get("uniqueId"))
+            if position is None:
+                self.local_index[chatbot.get("uniqueId")] = len(self.local_chatbots)
+                self.local_chatbots.append(chatbot)
+                counts["created"] += 1
+            elif self.upsert:
+                self.local_chatbots[position] = chatbot
+                counts["updated"] += 1
+            else:
+                errors.append({"line": line, "uniqueId": chatbot.get("uniqueId"),
+                               "error": "Chatbot with this uniqueId already exists"})
+        return counts, errors
+
+    def commit(self):
+        if self.conn is not None:
+            self.conn.commit()
+            logger.info("Committed bulk chatbot import to PostgreSQL")
+        else:
+            with open(LOCAL_STORAGE_FILE, 'w') as f:
+                json.dump({"chatbots": self.local_chatbots}, f, indent=2)
+            logger.info("Committed bulk chatbot import to local storage")
+
+    def close(self):
+        """Roll back anything uncommitted and release the connection"""
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+        self.local_chatbots = None
+        self.local_index = None
+
+def iter_chatbot_json_batches(batch_size: int = 500) -> Iterator[List[str]]:
+    """
+    Yield every chatbot as JSON text, a batch at a time, through a server-side cursor.
+
+    Rows are selected as data::text so nothing is decoded into Python objects.
+    PostgreSQL errors before the first batch fall back to local storage.
+    """
+    if not using_postgres:
+        init_db()  # Try to initialize PostgreSQL connection again
+
+    if using_postgres:
+        started = False
+        try:
+            with get_db_connection() as conn:
+                # Named cursors live on the server and are fetched batch_size rows at a time
+                with conn.cursor(name="chatbots_json") as cur:
+                    cur.execute("SELECT data::text FROM chatbots ORDER BY unique_id")
+                    while True:
+                        rows = cur.fetchmany(batch_size)
+                        if not rows:
+                            break
+                        started = True
+                        yield [row[0] for row in rows]
+            return
+        except Exception as e:
+            if started:
+                raise
+            logger.error(f"Error reading chatbots from PostgreSQL: {e}")
+            logger.info("PostgreSQL failed, trying local storage as fallback for retrieving chatbots...")
+
+    if LOCAL_STORAGE_FILE.exists():
+        with open(LOCAL_STORAGE_FILE, 'r') as f:
+            chatbots = json.load(f).get("chatbots", [])
+        for start in range(0, len(chatbots), batch_size):
+            yield [json.dumps(chatbot) for chatbot in chatbots[start:start + batch_size]]
+
 def get_health_info():
     """Get health information about the database connection"""
     try:
@@ -534,6 +838,7 @@ def get_health_info():
                         "version": version,
                         "connected": True,
                         "chatbot_count": count,
+                        "search_trigram": search_trigram,
                         "connection_string": f"postgresql://{DB_USER}:***@{DB_HOST}:{DB_PORT}/{DB_NAME}"
                     }
         else:
@@ -559,5 +864,4 @@ def get_health_info():
             "error": str(e)
         }
 
-# Initialize the database when this module is imported
-init_db() 
\ No newline at end of file
+# The application initializes the database at startup (open_pool); other callers run init_db() themselves 
\ No newline at end of file
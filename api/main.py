@@ -1,7 +1,6 @@
-from fastapi import FastAPI, HTTPException, File,UploadFile, Query, Form, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, File,UploadFile, Query, Form, WebSocket, WebSocketDisconnect, Request, Response, Header
 from fastapi.responses import FileResponse, PlainTextResponse, RedirectResponse, StreamingResponse, JSONResponse
-from pydantic import BaseModel
-import requests
+from pydantic import BaseModel, ValidationError
 import shutil
 from typing import List, Dict, Any, Optional
 from pathlib import Path
@@ -9,20 +8,55 @@ import logging
 import os
 from fastapi.middleware.cors import CORSMiddleware
 import json
-import re
+import time
 import uuid
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 import asyncio
-import httpx
 from fastapi import Depends
+from fastapi.concurrency import run_in_threadpool
 import database_pg as database  # Import the PostgreSQL database module instead of MongoDB
+from connections import ConnectionManager
+from ws_protocol import negotiate_encoder
+import widget_cache
+import upstream
+import worker_status
 import datetime
 
 # Load environment variables
 load_dotenv()
 
+# Startup progress, reported by /readyz
+startup_state = {"ready": False, "warmup_ms": None, "postgres": None, "upstream": None}
+
+async def warm_up():
+    """Open the database pool and the upstream connection in parallel, after the server is listening"""
+    start = time.perf_counter()
+    # httpx is imported in a worker thread so the event loop keeps answering meanwhile
+    await run_in_threadpool(upstream.preload)
+    postgres, upstream_ok = await asyncio.gather(
+        run_in_threadpool(database.open_pool),
+        upstream.warm_up(NEXT_AGI_BASE_URL),
+        return_exceptions=True
+    )
+    startup_state["postgres"] = postgres is True
+    startup_state["upstream"] = upstream_ok is True
+    startup_state["warmup_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    startup_state["ready"] = True
+    logger.info(f"Warm-up finished in {startup_state['warmup_ms']} ms "
+                f"(postgres={startup_state['postgres']}, upstream={startup_state['upstream']})")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Don't hold up binding the port: warm up in the background behind the /readyz gate
+    warmup_task = asyncio.create_task(warm_up())
+    yield
+    warmup_task.cancel()
+    await upstream.close()
+    await run_in_threadpool(database.close_pool)
+
 # Initialize FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Update CORS settings to allow requests from any origin
 origins = ["*"]
@@ -42,12 +76,15 @@ logger = logging.getLogger(__name__)
 # API key for Next-AGI (should be moved to environment variables)
 NEXT_AGI_API_KEY = os.getenv("NEXT_AGI_API_KEY", "your_api_key")
 logger.info(f"Using API key: {NEXT_AGI_API_KEY[:5]}...{NEXT_AGI_API_KEY[-4:] if len(NEXT_AGI_API_KEY) > 10 else ''}")
-NEXT_AGI_BASE_URL = "http://api.next-agi.com/v1"
+NEXT_AGI_BASE_URL = os.getenv("NEXT_AGI_BASE_URL", "http://api.next-agi.com/v1")
 
 # Create uploads directory if it doesn't exist
 UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
 
+# Rows per multi-row INSERT for bulk chatbot imports
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "500"))
+
 # Data models for chat API
 class FileUpload(BaseModel):
     type: str
@@ -85,6 +122,26 @@ class ChatbotModel(BaseModel):
     uniqueId: Optional[str] = None
     id: Optional[str] = None
 
+# Partial chatbot update; only the fields present in the request are applied
+class ChatbotPatchModel(BaseModel):
+    name: Optional[str] = None
+    chatLogoColor: Optional[str] = None
+    chatLogoImage: Optional[str] = None
+    iconAvatarImage: Optional[str] = None
+    staticImage: Optional[str] = None
+    chatHeaderColor: Optional[str] = None
+    chatBgGradientStart: Optional[str] = None
+    chatBgGradientEnd: Optional[str] = None
+    bodyBackgroundImage: Optional[str] = None
+    welcomeText: Optional[str] = None
+    apiKey: Optional[str] = None
+    analyticsUrl: Optional[str] = None
+
+# Fields ChatbotModel requires, which a patch may change but not clear
+REQUIRED_CHATBOT_FIELDS = [
+    name for name, field in ChatbotModel.model_fields.items() if field.is_required()
+]
+
 # Function to retrieve the API key
 def get_api_key():
     api_key = os.getenv("NEXT_AGI_API_KEY")
@@ -93,47 +150,189 @@ def get_api_key():
     return api_key
 
 # WebSocket connection manager
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}
-
-    async def connect(self, websocket: WebSocket, client_id: str):
-        await websocket.accept()
-        self.active_connections[client_id] = websocket
+manager = ConnectionManager()
 
-    def disconnect(self, client_id: str):
-        if client_id in self.active_connections:
-            del self.active_connections[client_id]
+# /chat SSE responses currently streaming in this process
+active_sse_streams = 0
 
-    async def send_message(self, message: str, client_id: str):
-        if client_id in self.active_connections:
-            await self.active_connections[client_id].send_text(message)
+def worker_stats() -> Dict[str, int]:
+    """Stream counts this process reports to the production supervisor"""
+    return {**manager.status(), "sse_streams": active_sse_streams}
 
-    async def broadcast(self, message: str):
-        for connection in self.active_connections.values():
-            await connection.send_text(message)
+# Hooks used by the production supervisor (run.py --production) to report on and drain a worker
+app.state.worker_stats = worker_stats
+app.state.drain = manager.drain
 
-manager = ConnectionManager()
+# Protects the /admin endpoints when set
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
 
 # API Routes
 @app.get("/")
 async def root():
     return {"message": "Welcome to the Chatbot API"}
 
+def raw_json_response(content: str, status_code: int = 200, headers: Optional[Dict[str, str]] = None) -> Response:
+    """Send JSON text that is already serialized (e.g. straight from PostgreSQL) as is"""
+    return Response(content=content, status_code=status_code, media_type="application/json", headers=headers)
+
 # Chatbot management endpoints
 @app.get("/chatbots")
 async def get_chatbots():
-    """Get all chatbots from the database"""
-    chatbots = database.get_all_chatbots()
-    return chatbots
+    """Get all chatbots from the database, streamed as a JSON array of the stored documents"""
+    def json_array():
+        first = True
+        for batch in database.iter_chatbot_json_batches():
+            yield ("[" if first else ",") + ",".join(batch)
+            first = False
+        yield "[]" if first else "]"
+
+    return StreamingResponse(json_array(), media_type="application/json")
+
+async def iter_ndjson_lines(request: Request):
+    """Yield (line number, raw line) for each non-empty line of a streamed NDJSON body"""
+    buffer = b""
+    line_number = 0
+    async for chunk in request.stream():
+        buffer += chunk
+        lines = buffer.split(b"\n")
+        buffer = lines.pop()
+        for line in lines:
+            line_number += 1
+            if line.strip():
+                yield line_number, line
+    if buffer.strip():
+        yield line_number + 1, buffer
+
+@app.post("/chatbots/bulk")
+async def bulk_import_chatbots(request: Request, upsert: bool = Query(False)):
+    """
+    Import chatbots from an NDJSON body (one chatbot per line) in a single transaction.
+    Invalid or conflicting rows are reported by line number; all other rows are written.
+    """
+    received = 0
+    counts = {"created": 0, "updated": 0}
+    errors = []
+    writer = database.BulkWriter(upsert=upsert)
+
+    async def flush(batch):
+        batch_counts, batch_errors = await run_in_threadpool(writer.write_batch, batch)
+        counts["created"] += batch_counts["created"]
+        counts["updated"] += batch_counts["updated"]
+        errors.extend(batch_errors)
+
+    try:
+        await run_in_threadpool(writer.open)
+        batch = []
+        async for line_number, line in iter_ndjson_lines(request):
+            received += 1
+            try:
+                chatbot = ChatbotModel.model_validate_json(line)
+            except ValidationError as e:
+                errors.append({
+                    "line": line_number,
+                    "error": "; ".join(f"{'.'.join(map(str, err['loc'])) or 'line'}: {err['msg']}" for err in e.errors())
+                })
+                continue
+
+            # Generate identifiers the same way POST /chatbots does
+            if not chatbot.uniqueId:
+                chatbot.uniqueId = str(uuid.uuid4())[:12]
+            if not chatbot.id:
+                chatbot.id = str(int(uuid.uuid4().int % 1000000000))
+
+            batch.append((line_number, chatbot.model_dump()))
+            if len(batch) >= BULK_BATCH_SIZE:
+                await flush(batch)
+                batch = []
+        if batch:
+            await flush(batch)
+        await run_in_threadpool(writer.commit)
+        if upsert:
+            # Any cached widget may have been overwritten
+            widget_cache.invalidate()
+    except Exception as e:
+        logger.exception(f"Exception in bulk_import_chatbots: {str(e)}")
+        return JSONResponse(
+            status_code=500,
+            content={"status": "error", "message": f"Bulk import failed, nothing was written: {str(e)}"}
+        )
+    finally:
+        await run_in_threadpool(writer.close)
+
+    errors.sort(key=lambda error: error["line"])
+    return {
+        "status": "success" if not errors else "partial",
+        "received": received,
+        "created": counts["created"],
+        "updated": counts["updated"],
+        "errors": errors
+    }
+
+@app.get("/chatbots/export")
+async def export_chatbots():
+    """Stream every chatbot as NDJSON without loading the table into memory"""
+    def ndjson():
+        for batch in database.iter_chatbot_json_batches():
+            yield "\n".join(batch) + "\n"
+
+    return StreamingResponse(
+        ndjson(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="chatbots.ndjson"'}
+    )
+
+@app.get("/chatbots/search")
+async def search_chatbots(
+    q: str = Query(..., min_length=1, max_length=100),
+    prefix: bool = Query(False),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0)
+):
+    """Search chatbots by name and welcome text (prefix=true for name typeahead), ranked and paged"""
+    results, has_more = await run_in_threadpool(
+        database.search_chatbots, q, prefix=prefix, limit=limit, offset=offset
+    )
+    return {
+        "query": q,
+        "results": results,
+        "limit": limit,
+        "offset": offset,
+        "has_more": has_more
+    }
 
 @app.get("/chatbots/{unique_id}")
 async def get_chatbot(unique_id: str):
     """Get a specific chatbot by unique ID"""
-    chatbot = database.get_chatbot_by_unique_id(unique_id)
-    if not chatbot:
+    chatbot_json, version = database.get_chatbot_json(unique_id)
+    if not chatbot_json:
         raise HTTPException(status_code=404, detail="Chatbot not found")
-    return chatbot
+    # The version doubles as an ETag for If-Match on PATCH
+    return raw_json_response(chatbot_json, headers={"ETag": f'"{version}"'})
+
+@app.get("/chatbots/{unique_id}/widget")
+async def get_chatbot_widget(unique_id: str, request: Request):
+    """
+    Public rendering config for a chatbot (no apiKey), served from pre-compressed
+    bytes cached per chatbot version. Safe for CDN caching.
+    """
+    entry = widget_cache.lookup(unique_id)
+    if entry is None:
+        chatbot, version = await run_in_threadpool(database.get_chatbot_with_version, unique_id)
+        if not chatbot:
+            raise HTTPException(status_code=404, detail="Chatbot not found")
+        entry = await run_in_threadpool(widget_cache.store, unique_id, chatbot, version)
+
+    body, encoding = entry.body(request.headers.get("accept-encoding", ""))
+    # Each encoding is a distinct representation, so it gets its own strong ETag
+    etag = f'"{entry.etag}-{encoding}"' if encoding else f'"{entry.etag}"'
+    headers = {"ETag": etag, "Cache-Control": widget_cache.WIDGET_CACHE_CONTROL, "Vary": "Accept-Encoding"}
+
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
 
 @app.post("/chatbots")
 async def create_chatbot(chatbot: ChatbotModel):
@@ -147,19 +346,20 @@ async def create_chatbot(chatbot: ChatbotModel):
         if not chatbot.id:
             chatbot.id = str(int(uuid.uuid4().int % 1000000000))
         
-        # Convert to dict and then to json and back to ensure everything is serializable
-        chatbot_data = json.loads(json.dumps(chatbot.dict()))
+        # Serialize once with pydantic; the same text is stored and echoed back
+        chatbot_data = chatbot.model_dump()
+        chatbot_json = chatbot.model_dump_json()
         
-        logger.debug(f"Chatbot data to save: {chatbot_data}")
+        logger.debug(f"Chatbot to save: {chatbot.uniqueId} ({len(chatbot_json)} bytes)")
         
-        success = database.create_chatbot(chatbot_data)
+        success = database.create_chatbot(chatbot_data, chatbot_json)
         
         if not success:
             logger.error("Failed to create chatbot in database")
             raise HTTPException(status_code=500, detail="Failed to create chatbot")
         
         # Return the exact same format the frontend expects
-        return {"status": "success", "chatbot": chatbot_data}
+        return raw_json_response(f'{{"status":"success","chatbot":{chatbot_json}}}')
     except Exception as e:
         logger.exception(f"Exception in create_chatbot: {str(e)}")
         # Use a more generic response format for errors
@@ -172,33 +372,94 @@ async def create_chatbot(chatbot: ChatbotModel):
 async def update_chatbot(unique_id: str, chatbot: ChatbotModel):
     """Update an existing chatbot"""
     try:
-        # Check if chatbot exists
-        existing_chatbot = database.get_chatbot_by_unique_id(unique_id)
-        if not existing_chatbot:
+        # Merge the submitted fields in a single UPDATE ... RETURNING round trip
+        chatbot_data = chatbot.model_dump(exclude_unset=True)
+        logger.debug(f"Updating chatbot {unique_id} fields: {list(chatbot_data)}")
+        
+        status, updated_chatbot, version = database.patch_chatbot(
+            unique_id, chatbot_data, changes_json=chatbot.model_dump_json(exclude_unset=True)
+        )
+        widget_cache.invalidate(unique_id)
+        if chatbot_data.get("uniqueId"):
+            widget_cache.invalidate(chatbot_data["uniqueId"])
+        
+        if status == "not_found":
             return JSONResponse(
                 status_code=404, 
                 content={"status": "error", "message": "Chatbot not found"}
             )
+        if status != "ok":
+            logger.error(f"Failed to update chatbot with ID {unique_id}")
+            return JSONResponse(
+                status_code=500, 
+                content={"status": "error", "message": "Failed to update chatbot"}
+            )
         
-        # Update chatbot data - ensure it's fully serializable
-        chatbot_data = json.loads(json.dumps(chatbot.dict(exclude_unset=True)))
-        logger.debug(f"Updating chatbot data: {chatbot_data}")
+        return raw_json_response(
+            f'{{"status":"success","chatbot":{updated_chatbot}}}',
+            headers={"ETag": f'"{version}"'}
+        )
+    except Exception as e:
+        logger.exception(f"Exception in update_chatbot: {str(e)}")
+        return JSONResponse(
+            status_code=500,
+            content={"status": "error", "message": f"Failed to update chatbot: {str(e)}"}
+        )
+
+def parse_if_match(if_match: Optional[str]) -> Optional[str]:
+    """Extract the version from an If-Match header; None when absent or "*" """
+    if not if_match or if_match.strip() == "*":
+        return None
+    tag = if_match.split(",")[0].strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    return tag.strip('"')
+
+@app.patch("/chatbots/{unique_id}")
+async def patch_chatbot(unique_id: str, changes: ChatbotPatchModel, if_match: Optional[str] = Header(None)):
+    """
+    Partially update a chatbot with a single UPDATE ... RETURNING statement.
+    Send the ETag from a previous read as If-Match to fail with 412 instead of
+    overwriting a concurrent change.
+    """
+    try:
+        changes_data = changes.model_dump(exclude_unset=True)
+        null_fields = [field for field in REQUIRED_CHATBOT_FIELDS if field in changes_data and changes_data[field] is None]
+        if null_fields:
+            return JSONResponse(
+                status_code=422,
+                content={"status": "error", "message": f"Fields cannot be null: {', '.join(null_fields)}"}
+            )
         
-        success = database.update_chatbot(unique_id, chatbot_data)
+        status, chatbot, version = database.patch_chatbot(
+            unique_id, changes_data, parse_if_match(if_match),
+            changes_json=changes.model_dump_json(exclude_unset=True)
+        )
+        widget_cache.invalidate(unique_id)
         
-        if not success:
-            logger.error(f"Failed to update chatbot with ID {unique_id}")
+        if status == "not_found":
+            return JSONResponse(
+                status_code=404, 
+                content={"status": "error", "message": "Chatbot not found"}
+            )
+        if status == "conflict":
+            return JSONResponse(
+                status_code=412,
+                content={"status": "error", "message": "Chatbot was modified by another request"}
+            )
+        if status != "ok":
+            logger.error(f"Failed to patch chatbot with ID {unique_id}")
             return JSONResponse(
                 status_code=500, 
                 content={"status": "error", "message": "Failed to update chatbot"}
             )
         
-        # Get the updated chatbot data
-        updated_chatbot = database.get_chatbot_by_unique_id(unique_id)
-        
-        return {"status": "success", "chatbot": updated_chatbot}
+        return raw_json_response(
+            f'{{"status":"success","chatbot":{chatbot}}}',
+            headers={"ETag": f'"{version}"'}
+        )
     except Exception as e:
-        logger.exception(f"Exception in update_chatbot: {str(e)}")
+        logger.exception(f"Exception in patch_chatbot: {str(e)}")
         return JSONResponse(
             status_code=500,
             content={"status": "error", "message": f"Failed to update chatbot: {str(e)}"}
@@ -218,6 +479,7 @@ async def delete_chatbot(unique_id: str):
         
         # Delete chatbot
         success = database.delete_chatbot(unique_id)
+        widget_cache.invalidate(unique_id)
         
         if not success:
             logger.error(f"Failed to delete chatbot with ID {unique_id}")
@@ -271,49 +533,51 @@ async def chat(request: ChatRequest, nextagi_api_key: str = Depends(get_api_key)
     
     # Set up streaming response
     async def process_stream():
+        global active_sse_streams
+        active_sse_streams += 1
         try:
-            async with httpx.AsyncClient() as client:
-                async with client.stream("POST", url, json=body, headers=headers, timeout=60.0) as response:
-                    response.raise_for_status()
+            client = upstream.get_client()
+            async with client.stream("POST", url, json=body, headers=headers) as response:
+                response.raise_for_status()
                     
-                    # Variables to track the response data
-                    full_answer = ""
-                    conversation_id = request.conversation_id or str(uuid.uuid4())
+                # Variables to track the response data
+                full_answer = ""
+                conversation_id = request.conversation_id or str(uuid.uuid4())
                     
-                    # Stream the response as Server-Sent Events (SSE)
-                    yield f"data: {json.dumps({'type': 'start'})}\n\n"
+                # Stream the response as Server-Sent Events (SSE)
+                yield f"data: {json.dumps({'type': 'start'})}\n\n"
                     
-                    async for chunk in response.aiter_text():
-                        if chunk.strip():
-                            for line in chunk.strip().split("\n"):
-                                if line.startswith("data: "):
-                                    data = line[6:]  # Remove "data: " prefix
-                                    try:
-                                        data_json = json.loads(data)
-                                        if "message" in data_json:
-                                            message = data_json["message"]
-                                            if "content" in message:
-                                                content = message["content"]
-                                                full_answer += content
-                                                # Forward the text fragment as SSE with proper JSON formatting
-                                                fragment_data = {
-                                                    "type": "fragment",
-                                                    "content": content,
-                                                    "conversation_id": conversation_id
-                                                }
-                                                yield f"data: {json.dumps(fragment_data)}\n\n"
-                                            if "conversation_id" in data_json:
-                                                conversation_id = data_json["conversation_id"]
-                                    except json.JSONDecodeError:
-                                        logger.error(f"Failed to decode JSON: {data}")
+                async for chunk in response.aiter_text():
+                    if chunk.strip():
+                        for line in chunk.strip().split("\n"):
+                            if line.startswith("data: "):
+                                data = line[6:]  # Remove "data: " prefix
+                                try:
+                                    data_json = json.loads(data)
+                                    if "message" in data_json:
+                                        message = data_json["message"]
+                                        if "content" in message:
+                                            content = message["content"]
+                                            full_answer += content
+                                            # Forward the text fragment as SSE with proper JSON formatting
+                                            fragment_data = {
+                                                "type": "fragment",
+                                                "content": content,
+                                                "conversation_id": conversation_id
+                                            }
+                                            yield f"data: {json.dumps(fragment_data)}\n\n"
+                                        if "conversation_id" in data_json:
+                                            conversation_id = data_json["conversation_id"]
+                                except json.JSONDecodeError:
+                                    logger.error(f"Failed to decode JSON: {data}")
                     
-                    # Send the complete answer at the end
-                    complete_data = {
-                        "type": "complete",
-                        "answer": full_answer,
-                        "conversation_id": conversation_id
-                    }
-                    yield f"data: {json.dumps(complete_data)}\n\n"
+                # Send the complete answer at the end
+                complete_data = {
+                    "type": "complete",
+                    "answer": full_answer,
+                    "conversation_id": conversation_id
+                }
+                yield f"data: {json.dumps(complete_data)}\n\n"
                     
         except Exception as e:
             logger.error(f"Error in streaming response: {str(e)}")
@@ -322,6 +586,8 @@ async def chat(request: ChatRequest, nextagi_api_key: str = Depends(get_api_key)
                 "error": str(e)
             }
             yield f"data: {json.dumps(error_data)}\n\n"
+        finally:
+            active_sse_streams -= 1
     
     return StreamingResponse(process_stream(), media_type="text/event-stream")
 
@@ -342,10 +608,6 @@ async def upload_file(file: UploadFile = File(...), user: str = Form(...)):
             shutil.copyfileobj(file.file, buffer)
         
         # Forward to Next-AGI
-        files = {
-            'file': (file.filename, open(file_path, 'rb'), file.content_type)
-        }
-        
         data = {
             'user': user
         }
@@ -354,12 +616,16 @@ async def upload_file(file: UploadFile = File(...), user: str = Form(...)):
             "Authorization": f"Bearer {NEXT_AGI_API_KEY}"
         }
         
-        response = requests.post(
-            f"{NEXT_AGI_BASE_URL}/files/upload",
-            headers=headers,
-            files=files,
-            data=data
-        )
+        with open(file_path, 'rb') as upload:
+            files = {
+                'file': (file.filename, upload, file.content_type)
+            }
+            response = await upstream.get_client().post(
+                f"{NEXT_AGI_BASE_URL}/files/upload",
+                headers=headers,
+                files=files,
+                data=data
+            )
         
         response.raise_for_status()
         return response.json()
@@ -370,32 +636,47 @@ async def upload_file(file: UploadFile = File(...), user: str = Form(...)):
 
 @app.websocket("/ws/{client_id}")
 async def websocket_endpoint(websocket: WebSocket, client_id: str):
-    conversation_id = ""
     """
     WebSocket endpoint for real-time chat
     """
-    await manager.connect(websocket, client_id)
+    connection = await manager.connect(websocket, client_id)
+    if connection is None:
+        return
+    conversation_id = ""
     api_key = None  # Initialize API key variable
-    
+
     try:
         while True:
             data = await websocket.receive_text()
-            
+            connection.touch()
+
             # Parse the received data
             try:
                 message_data = json.loads(data)
                 logging.info(f"Message data: {message_data}")
-                
+
                 # Get API key from the message data
-                if "api_key" in message_data:
+                if message_data.get("api_key"):
                     api_key = message_data["api_key"]
                     logging.info(f"Using API key from message: {api_key[:5]}...{api_key[-4:] if len(api_key) > 10 else ''}")
-                
+
+                # Widgets loaded from /widget carry no apiKey; resolve it from the chatbot once
+                if not api_key and message_data.get("chatbot_id"):
+                    chatbot = await run_in_threadpool(database.get_chatbot_by_unique_id, str(message_data["chatbot_id"]))
+                    if chatbot and chatbot.get("apiKey"):
+                        api_key = chatbot["apiKey"]
+                        logging.info(f"Using API key of chatbot {message_data['chatbot_id']}")
+
                 # Use default API key if none provided
                 if not api_key:
                     api_key = NEXT_AGI_API_KEY
                     logging.info(f"Using default API key: {api_key[:5]}...{api_key[-4:] if len(api_key) > 10 else ''}")
-                
+
+                # Negotiate the frame encoding advertised in the init message
+                if message_data.get("type") == "init" and "protocol" in message_data:
+                    connection.encoder = negotiate_encoder(message_data["protocol"])
+                    await manager.send_frames(connection.encoder.init(), connection)
+
                 # Process chat message
                 if "query" in message_data:
                     logging.info(f"Query: {message_data['query']}")
@@ -409,116 +690,120 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str):
                         "user": client_id,
                         "files": message_data.get("files", [])
                     }
-                    
+
                     # Use the API key from the message
                     headers = {
                         "Authorization": f"Bearer {api_key}",
                         "Content-Type": "application/json"
                     }
-                    
-                    # Generate a new conversation ID if not provided
+
                     logging.info(f"payload: {payload}")
                     logger.debug(f"Conversation ID0: {conversation_id}")
-                    
+
+                    # Keep the reaper away while the answer is streaming
+                    connection.streaming = True
                     try:
-                        # Make request with streaming enabled
+                        # Make request with streaming enabled; the async client keeps the
+                        # event loop free for heartbeats and other connections
                         api_url = f"{NEXT_AGI_BASE_URL}/chat-messages"
                         logging.info(f"API URL: {api_url}")
                         logging.info(f"Headers: {headers}")
                         logging.info(f"Payload: {payload}")
-                        response = requests.post(
-                            api_url,
-                            headers=headers,
-                            json=payload,
-                            stream=True
-                        )
-                        logging.info(f"Response: {response}")
-                        # Check for HTTP error
-                        if not response.ok:
-                            logger.error(f"API Error in WebSocket: Status code {response.status_code}")
-                            await manager.send_message(json.dumps({
-                                "type": "error",
-                                "content": f"API error: Status code {response.status_code}"
-                            }), client_id)
-                            continue
-                            
-                        # Handle SSE (Server-Sent Events) streaming response
-                        if 'text/event-stream' in response.headers.get('content-type', ''):
-                            for line in response.iter_lines():
-                                if line:
-                                    line = line.decode('utf-8')
-                                    #logger.debug(f"Received WebSocket line: {line}")
-                                    
+                        client = upstream.get_client()
+                        async with client.stream("POST", api_url, headers=headers, json=payload) as response:
+                            logging.info(f"Response: {response}")
+                            # Check for HTTP error
+                            if response.is_error:
+                                logger.error(f"API Error in WebSocket: Status code {response.status_code}")
+                                await manager.send_frames(connection.encoder.error(
+                                    f"API error: Status code {response.status_code}"
+                                ), connection)
+                                continue
+
+                            # Handle SSE (Server-Sent Events) streaming response
+                            if 'text/event-stream' in response.headers.get('content-type', ''):
+                                async for line in response.aiter_lines():
                                     # SSE format starts with "data: "
                                     if line.startswith("data: "):
                                         try:
                                             # Parse the JSON data after "data: "
                                             event_data = json.loads(line[6:])
-                                            #logger.debug(f"Event data: {event_data}")
+                                            conversation_id = event_data.get("conversation_id", conversation_id)
                                             # Extract and send answer fragments
                                             if "answer" in event_data:
                                                 answer_fragment = event_data["answer"]
-                                                await manager.send_message(json.dumps({
-                                                    "type": "chunk",
-                                                    "content": answer_fragment,
-                                                    "conversation_id": event_data['conversation_id']
-                                                }), client_id)
+                                                await manager.send_frames(
+                                                    connection.encoder.chunk(answer_fragment, conversation_id),
+                                                    connection
+                                                )
                                                 await asyncio.sleep(0.05)  # Small delay for smooth streaming
                                         except json.JSONDecodeError as e:
                                             logger.error(f"Error parsing SSE event in WebSocket: {e}")
-                            logger.debug(f"Received WebSocket line: {line}")
-                            logger.debug(f"Conversation ID: {conversation_id}")
-                            conversation_id = line["conversation_id"]
-                            # Send end event
-                            #await manager.send_message(json.dumps({
-                            #    "type": "end",
-                            #    "conversation_id": conversation_id
-                            #}), client_id)
-                        else:
-                            # Fallback for non-streaming responses
-                            try:
-                                response_data = response.json()
-                                answer = response_data.get("answer", "No response from API")
-                                
-                                # Simulate streaming with the complete answer
-                                words = answer.split()
-                                chunk_size = 2  # Send 2 words at a time
-                                
-                                for i in range(0, len(words), chunk_size):
-                                    chunk = " ".join(words[i:i+chunk_size])
-                                    await manager.send_message(json.dumps({
-                                        "type": "chunk",
-                                        "content": chunk,
-                                        "conversation_id": conversation_id
-                                    }), client_id)
-                                    await asyncio.sleep(0.1)  # Simulate streaming delay
-                                
-                                await manager.send_message(json.dumps({
-                                    "type": "end",
-                                    "conversation_id": conversation_id
-                                }), client_id)
-                            except Exception as e:
-                                logger.error(f"Error parsing non-streaming response: {e}")
-                                await manager.send_message(json.dumps({
-                                    "type": "error",
-                                    "content": "Error processing response"
-                                }), client_id)
+                                logger.debug(f"Conversation ID: {conversation_id}")
+                                # Send end event
+                                await manager.send_frames(connection.encoder.end(conversation_id), connection)
+                            else:
+                                # Fallback for non-streaming responses
+                                try:
+                                    await response.aread()
+                                    response_data = response.json()
+                                    answer = response_data.get("answer", "No response from API")
+
+                                    # Simulate streaming with the complete answer
+                                    words = answer.split()
+                                    chunk_size = 2  # Send 2 words at a time
+
+                                    for i in range(0, len(words), chunk_size):
+                                        chunk = " ".join(words[i:i+chunk_size])
+                                        await manager.send_frames(
+                                            connection.encoder.chunk(chunk, conversation_id),
+                                            connection
+                                        )
+                                        await asyncio.sleep(0.1)  # Simulate streaming delay
+
+                                    await manager.send_frames(connection.encoder.end(conversation_id), connection)
+                                except Exception as e:
+                                    logger.error(f"Error parsing non-streaming response: {e}")
+                                    await manager.send_frames(
+                                        connection.encoder.error("Error processing response"),
+                                        connection
+                                    )
+                    except WebSocketDisconnect:
+                        raise
                     except Exception as e:
                         logger.error(f"Error in websocket chat: {e}")
-                        await manager.send_message(json.dumps({
-                            "type": "chunk",
-                            "content": "",
-                            "conversation_id": conversation_id
-                        }), client_id)
-            
+                        await manager.send_frames(connection.encoder.chunk("", conversation_id), connection)
+                    finally:
+                        connection.streaming = False
+                        connection.touch()
+
             except json.JSONDecodeError:
-                await manager.send_message(json.dumps({
-                    "type": "error",
-                    "content": "Invalid JSON format"
-                }), client_id)
-    
+                await manager.send_frames(connection.encoder.error("Invalid JSON format"), connection)
+
     except WebSocketDisconnect:
-        manager.disconnect(client_id)
+        pass
+    except Exception as e:
+        logger.error(f"Unexpected WebSocket error for client {client_id}: {e}")
+    finally:
+        # Always release the registry slot, however the connection ended
+        await manager.close(connection)
+
+@app.get("/readyz")
+async def readiness_check():
+    """Readiness gate: 503 until the startup warm-up has finished"""
+    if not startup_state["ready"]:
+        return JSONResponse(status_code=503, content={"status": "starting", **startup_state})
+    return {"status": "ready", **startup_state}
+
+@app.get("/admin/workers")
+async def admin_workers(x_admin_token: Optional[str] = Header(None)):
+    """Supervisor and per-worker status in production mode, or this process's own stats otherwise"""
+    if ADMIN_TOKEN and x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+    status = await run_in_threadpool(worker_status.read_all)
+    if status["mode"] == "single":
+        status["workers"] = [{"pid": os.getpid(), "state": "serving", **worker_stats()}]
+    return status
 
 @app.get("/health", status_code=200)
 async def health_check():
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Online migration of the chatbots table to the lean row layout.
+
+The original layout stored every field twice: in typed columns (chat_logo_image,
+welcome_text, ...) and again in the data JSONB. The lean layout keeps only
+unique_id (primary key), data and version, with an expression index on data->>'id'.
+
+Every step runs without blocking reads or writes for longer than --lock-timeout:
+1. Backfill data for any row that only has typed columns, in batches
+2. Make data NOT NULL through a NOT VALID check constraint validated online
+3. Build the data->>'id' expression index CONCURRENTLY
+4. Drop the typed columns (a catalog-only change)
+5. Rewrite rows in batches so the dropped values (and their TOAST) are released,
+   then VACUUM so the space can be reused
+
+The application already writes the lean layout, so it can be deployed before or
+after this script runs. Re-running the script is safe.
+
+Usage:
+    python migrate_row_layout.py [--batch-size 1000] [--lock-timeout 5s] [--yes]
+"""
+
+import time
+import logging
+import argparse
+from typing import Dict, Any
+
+import psycopg2.errors
+
+import database_pg as pg_db
+
+logger = logging.getLogger(__name__)
+
+
+def table_stats(cur) -> Dict[str, Any]:
+    """Row count, on-disk sizes and the average stored row size of the chatbots table"""
+    cur.execute("""
+        SELECT (SELECT COUNT(*) FROM chatbots), pg_total_relation_size('chatbots'), pg_relation_size('chatbots'),
+               COALESCE(pg_total_relation_size(NULLIF(reltoastrelid, 0)), 0),
+               (SELECT AVG(pg_column_size(c.*))::BIGINT FROM chatbots c)
+        FROM pg_class WHERE oid = 'chatbots'::regclass
+    """)
+    count, total, heap, toast, row = cur.fetchone()
+    return {"rows": count, "total_bytes": total, "heap_bytes": heap, "toast_bytes": toast, "avg_row_bytes": row}
+
+
+def log_stats(label: str, stats: Dict[str, Any]):
+    logger.info(f"{label}: {stats['rows']} rows, total {stats['total_bytes']} bytes "
+                f"(heap {stats['heap_bytes']}, TOAST {stats['toast_bytes']}), avg row {stats['avg_row_bytes']} bytes")
+
+
+def legacy_columns(cur):
+    cur.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'chatbots'
+    """)
+    return [name for (name,) in cur.fetchall() if name in pg_db.LEGACY_COLUMNS.values()]
+
+
+def ddl(cur, statement: str, lock_timeout: str, attempts: int = 10):
+    """Run a DDL statement that needs a brief exclusive lock, retrying instead of queueing behind long transactions"""
+    for attempt in range(1, attempts + 1):
+        try:
+            cur.execute(f"SET lock_timeout = '{lock_timeout}'")
+            cur.execute(statement)
+            cur.execute("RESET lock_timeout")
+            return
+        except psycopg2.errors.LockNotAvailable:
+            logger.warning(f"Lock not available (attempt {attempt}/{attempts}): {statement}")
+            time.sleep(attempt)
+    raise RuntimeError(f"Could not acquire lock for: {statement}")
+
+
+def backfill_data(cur, columns, batch_size: int) -> int:
+    """Build data from the typed columns for rows written without it"""
+    pairs = ["'uniqueId', unique_id"] + [f"'{field}', {column}" for field, column in pg_db.LEGACY_COLUMNS.items()
+                                         if column in columns]
+    document = f"jsonb_strip_nulls(jsonb_build_object({', '.join(pairs)}))"
+    total = 0
+    while True:
+        cur.execute(f"""
+            UPDATE chatbots SET data = {document}
+            WHERE unique_id IN (SELECT unique_id FROM chatbots WHERE data IS NULL LIMIT %s)
+        """, (batch_size,))
+        total += cur.rowcount
+        if cur.rowcount < batch_size:
+            return total
+
+
+def rewrite_rows(cur, batch_size: int) -> int:
+    """Touch every row in key order so new tuples no longer carry the dropped columns"""
+    last_unique_id = ""
+    total = 0
+    while True:
+        cur.execute("""
+            UPDATE chatbots SET data = data
+            WHERE unique_id IN (
+                SELECT unique_id FROM chatbots WHERE unique_id > %s ORDER BY unique_id LIMIT %s
+            )
+            RETURNING unique_id
+        """, (last_unique_id, batch_size))
+        written = [unique_id for (unique_id,) in cur.fetchall()]
+        if not written:
+            return total
+        total += len(written)
+        last_unique_id = max(written)
+        logger.info(f"Rewrote {total} rows (up to uniqueId {last_unique_id})")
+
+
+def migrate(batch_size: int = 1000, lock_timeout: str = "5s") -> bool:
+    """Move the chatbots table to the lean layout; returns True when it is done"""
+    if not pg_db.init_db():
+        logger.error("PostgreSQL is not reachable; nothing to migrate")
+        return False
+
+    with pg_db.get_db_connection() as conn:
+        # Autocommit: every batch is its own short transaction and CONCURRENTLY needs it
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            before = table_stats(cur)
+            log_stats("Before", before)
+            columns = legacy_columns(cur)
+            if not columns:
+                logger.info("chatbots already uses the lean layout")
+
+            # 1. Every row must have its document before the typed columns go away
+            if columns:
+                backfilled = backfill_data(cur, columns, batch_size)
+                logger.info(f"Backfilled data for {backfilled} rows")
+
+            # 2. NOT NULL without a long exclusive lock: the validated check lets SET NOT NULL skip its scan
+            cur.execute("""
+                SELECT is_nullable FROM information_schema.columns
+                WHERE table_schema = current_schema() AND table_name = 'chatbots' AND column_name = 'data'
+            """)
+            if cur.fetchone()[0] == "YES":
+                ddl(cur, "ALTER TABLE chatbots ADD CONSTRAINT chatbots_data_not_null "
+                         "CHECK (data IS NOT NULL) NOT VALID", lock_timeout)
+                cur.execute("ALTER TABLE chatbots VALIDATE CONSTRAINT chatbots_data_not_null")
+                ddl(cur, "ALTER TABLE chatbots ALTER COLUMN data SET NOT NULL", lock_timeout)
+                ddl(cur, "ALTER TABLE chatbots DROP CONSTRAINT chatbots_data_not_null", lock_timeout)
+                logger.info("data is now NOT NULL")
+
+            # 3. The lookup index the typed id column used to provide
+            cur.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_chatbots_data_id ON chatbots ((data->>'id'))")
+            cur.execute("DROP INDEX CONCURRENTLY IF EXISTS idx_chatbots_id")
+
+            # 4. Dropping columns only marks them dropped in the catalog
+            if columns:
+                ddl(cur, "ALTER TABLE chatbots " + ", ".join(f"DROP COLUMN IF EXISTS {c}" for c in columns),
+                    lock_timeout)
+                logger.info(f"Dropped typed columns: {', '.join(columns)}")
+
+                # 5. Release the dropped values row by row, then make the space reusable
+                rewrite_rows(cur, batch_size)
+                cur.execute("VACUUM (ANALYZE) chatbots")
+
+            after = table_stats(cur)
+            log_stats("After", after)
+    return True
+
+
+def main():
+    """Entry point for the script"""
+    parser = argparse.ArgumentParser(description="Migrate the chatbots table to the lean row layout")
+    parser.add_argument("--batch-size", type=int, default=1000, help="rows per backfill/rewrite transaction")
+    parser.add_argument("--lock-timeout", default="5s", help="give up (and retry) DDL locks after this long")
+    parser.add_argument("--yes", action="store_true", help="do not ask for confirmation")
+    args = parser.parse_args()
+
+    print(f"This drops the duplicated typed columns from chatbots in {pg_db.DB_NAME} on {pg_db.DB_HOST}.")
+    if not args.yes:
+        choice = input("Do you want to proceed? (yes/no): ").strip().lower()
+        if choice not in ('yes', 'y'):
+            print("Migration cancelled.")
+            return
+
+    if migrate(batch_size=args.batch_size, lock_timeout=args.lock_timeout):
+        print("\n✅ Row layout migration completed successfully!")
+    else:
+        print("\n❌ Row layout migration failed. Please check the logs for details.")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,16 +3,25 @@
 Migration script to transfer chatbot data from MongoDB to PostgreSQL.
 This script will:
 1. Connect to the MongoDB database
-2. Read all existing chatbots
-3. Connect to the PostgreSQL database
-4. Insert all chatbots into PostgreSQL
-5. Verify the migration was successful
+2. Stream chatbots from a MongoDB cursor in uniqueId order, batch by batch
+3. Upsert each batch into PostgreSQL with multi-row statements, in parallel workers
+4. Checkpoint progress after every contiguous run of finished batches, so an
+   interrupted migration resumes where it stopped (re-running is idempotent)
+5. Verify the migration with row counts and a uniqueId checksum
+
+Usage:
+    python migrate_to_postgres.py [--batch-size 500] [--workers 4] [--backup mongodb_backup.ndjson] [--yes]
+    python migrate_to_postgres.py --verify-only
 """
 
 import os
 import logging
 import json
-from typing import List, Dict, Any
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import List, Dict, Any, Optional
 from dotenv import load_dotenv
 
 # Setup logging
@@ -25,90 +34,196 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
-def migrate_data():
+DEFAULT_CHECKPOINT_FILE = "migration_checkpoint.json"
+
+
+def unique_id_checksum(unique_id: str) -> int:
+    """Order-independent checksum contribution of one row (first 32 bits of md5, summed)"""
+    return int(hashlib.md5(unique_id.encode("utf-8")).hexdigest()[:8], 16)
+
+
+def load_checkpoint(path: str) -> Dict[str, Any]:
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            return json.load(f)
+    return {"last_unique_id": None, "migrated": 0, "skipped": 0, "errors": 0}
+
+
+def save_checkpoint(path: str, checkpoint: Dict[str, Any]):
+    # Write then rename so a crash never leaves a truncated checkpoint behind
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+
+def verify(mongo_db, pg_db, checkpoint: Dict[str, Any]) -> bool:
+    """Compare counts and uniqueId checksums; MongoDB is scanned by uniqueId only, no documents"""
+    mongo_count = 0
+    mongo_checksum = 0
+    ids = mongo_db.db.chatbots.find({"uniqueId": {"$exists": True, "$ne": None}}, {"_id": 0, "uniqueId": 1})
+    for doc in ids:
+        mongo_count += 1
+        mongo_checksum += unique_id_checksum(doc["uniqueId"])
+
+    with pg_db.get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT COUNT(*), COALESCE(SUM(('x' || SUBSTR(MD5(unique_id), 1, 8))::BIT(32)::BIGINT), 0)
+                FROM chatbots
+            """)
+            pg_count, pg_checksum = cur.fetchone()
+
+    logger.info(f"  - Chatbots with a uniqueId in MongoDB: {mongo_count}")
+    logger.info(f"  - Migrated according to checkpoint: {checkpoint['migrated']}")
+    logger.info(f"  - Chatbots in PostgreSQL: {pg_count}")
+    if pg_count != mongo_count:
+        logger.warning("Row counts differ between MongoDB and PostgreSQL")
+        return False
+    if int(pg_checksum) != mongo_checksum:
+        logger.warning("uniqueId checksums differ between MongoDB and PostgreSQL")
+        return False
+    logger.info("Counts and checksums match")
+    return True
+
+
+def migrate_data(batch_size: int = 500, workers: int = 4, checkpoint_file: str = DEFAULT_CHECKPOINT_FILE,
+                 backup_file: Optional[str] = None, verify_only: bool = False):
     """Main migration function"""
     logger.info("Starting migration from MongoDB to PostgreSQL")
-    
+
     # Import both database modules
     try:
         import database as mongo_db
         import database_pg as pg_db
-        
+
         # Initialize both databases
         logger.info("Initializing MongoDB connection")
         mongo_connected = mongo_db.init_db()
-        
+
         if not mongo_connected or not mongo_db.using_mongodb:
             logger.error("Failed to connect to MongoDB. Make sure MongoDB is running and properly configured.")
             return False
-        
+
         logger.info("Initializing PostgreSQL connection")
         pg_connected = pg_db.init_db()
-        
+
         if not pg_connected or not pg_db.using_postgres:
             logger.error("Failed to connect to PostgreSQL. Make sure PostgreSQL is running and properly configured.")
             return False
-        
-        # Get all chatbots from MongoDB
-        logger.info("Fetching chatbots from MongoDB")
-        mongo_chatbots = mongo_db.get_all_chatbots()
-        
-        if not mongo_chatbots:
-            logger.warning("No chatbots found in MongoDB. Nothing to migrate.")
-            return True
-        
-        logger.info(f"Found {len(mongo_chatbots)} chatbots in MongoDB")
-        
-        # Save a backup of the MongoDB data
-        backup_file = "mongodb_backup.json"
-        logger.info(f"Creating backup of MongoDB data to {backup_file}")
-        with open(backup_file, 'w') as f:
-            json.dump(mongo_chatbots, f, indent=2)
-        
-        # Migrate each chatbot to PostgreSQL
-        success_count = 0
-        error_count = 0
-        
-        for chatbot in mongo_chatbots:
-            try:
-                # Convert MongoDB's _id to a string if present (should have been removed already)
-                if '_id' in chatbot:
-                    # Convert ObjectId to string if needed
-                    if not isinstance(chatbot['_id'], str):
-                        chatbot['_id'] = str(chatbot['_id'])
-                
-                # Ensure uniqueId is set
-                if not chatbot.get('uniqueId'):
-                    logger.warning(f"Chatbot {chatbot.get('name', 'unknown')} has no uniqueId. Skipping.")
-                    error_count += 1
-                    continue
-                
-                # Insert the chatbot into PostgreSQL
-                logger.info(f"Migrating chatbot: {chatbot.get('name')} (ID: {chatbot.get('uniqueId')})")
-                success = pg_db.create_chatbot(chatbot)
-                
-                if success:
-                    success_count += 1
-                else:
-                    error_count += 1
-                    logger.error(f"Failed to migrate chatbot: {chatbot.get('name')}")
-            except Exception as e:
-                error_count += 1
-                logger.exception(f"Error migrating chatbot {chatbot.get('name', 'unknown')}: {e}")
-        
+
+        checkpoint = load_checkpoint(checkpoint_file)
+        if verify_only:
+            return verify(mongo_db, pg_db, checkpoint)
+
+        if checkpoint["last_unique_id"] is not None:
+            logger.info(f"Resuming after uniqueId {checkpoint['last_unique_id']} ({checkpoint['migrated']} already migrated)")
+
+        # Stream the remaining documents in uniqueId order so a checkpoint is a single key
+        query = {"uniqueId": {"$exists": True, "$ne": None}}
+        if checkpoint["last_unique_id"] is not None:
+            query["uniqueId"]["$gt"] = checkpoint["last_unique_id"]
+        cursor = mongo_db.db.chatbots.find(query, {"_id": 0}).sort("uniqueId", 1).batch_size(batch_size)
+        skipped = mongo_db.db.chatbots.count_documents({"$or": [{"uniqueId": {"$exists": False}}, {"uniqueId": None}]})
+        if skipped:
+            logger.warning(f"{skipped} chatbots have no uniqueId and will be skipped")
+        checkpoint["skipped"] = skipped
+
+        # One BulkWriter (and so one PostgreSQL connection) per worker thread
+        local = threading.local()
+        writers = []
+        writers_lock = threading.Lock()
+
+        def write_batch(batch: List[Dict[str, Any]]):
+            if not hasattr(local, "writer"):
+                local.writer = pg_db.BulkWriter(upsert=True)
+                local.writer.open()
+                with writers_lock:
+                    writers.append(local.writer)
+            counts, errors = local.writer.write_batch(list(enumerate(batch)))
+            local.writer.commit()
+            for error in errors:
+                logger.error(f"Failed to migrate chatbot {error['uniqueId']}: {error['error']}")
+            return counts["created"] + counts["updated"], len(errors)
+
+        backup = open(backup_file, 'a') if backup_file else None
+        pending = {}  # future -> (batch sequence number, last uniqueId in the batch)
+        finished = {}  # sequence number -> (last uniqueId, migrated, errors)
+        next_to_checkpoint = 0
+        sequence = 0
+        failed_batch = None
+
+        def advance_checkpoint():
+            # Only move past batches whose predecessors have all finished
+            nonlocal next_to_checkpoint
+            moved = False
+            while next_to_checkpoint in finished:
+                last_unique_id, migrated, errors = finished.pop(next_to_checkpoint)
+                checkpoint["last_unique_id"] = last_unique_id
+                checkpoint["migrated"] += migrated
+                checkpoint["errors"] += errors
+                next_to_checkpoint += 1
+                moved = True
+            if moved:
+                save_checkpoint(checkpoint_file, checkpoint)
+                logger.info(f"Checkpoint: {checkpoint['migrated']} migrated, last uniqueId {checkpoint['last_unique_id']}")
+
+        def collect(done):
+            nonlocal failed_batch
+            for future in done:
+                seq, last_unique_id = pending.pop(future)
+                try:
+                    migrated, errors = future.result()
+                    finished[seq] = (last_unique_id, migrated, errors)
+                except Exception as e:
+                    logger.exception(f"Batch {seq} failed: {e}")
+                    failed_batch = seq if failed_batch is None else min(failed_batch, seq)
+            advance_checkpoint()
+
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                batch = []
+                for chatbot in cursor:
+                    batch.append(chatbot)
+                    if backup:
+                        backup.write(json.dumps(chatbot, default=str) + "\n")
+                    if len(batch) < batch_size:
+                        continue
+                    # Keep at most two batches per worker in memory
+                    while len(pending) >= workers * 2:
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        collect(done)
+                    if failed_batch is not None:
+                        break
+                    pending[executor.submit(write_batch, batch)] = (sequence, batch[-1]["uniqueId"])
+                    sequence += 1
+                    batch = []
+                if batch and failed_batch is None:
+                    pending[executor.submit(write_batch, batch)] = (sequence, batch[-1]["uniqueId"])
+                    sequence += 1
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+        finally:
+            cursor.close()
+            if backup:
+                backup.close()
+            for writer in writers:
+                writer.close()
+
+        logger.info(f"Migration completed:")
+        logger.info(f"  - Successfully migrated: {checkpoint['migrated']}")
+        logger.info(f"  - Skipped (no uniqueId): {checkpoint['skipped']}")
+        logger.info(f"  - Errors: {checkpoint['errors']}")
+
+        if failed_batch is not None:
+            logger.error("Migration stopped on a failed batch; run the script again to resume from the checkpoint")
+            return False
+
         # Verify the migration
         logger.info("Verifying migration")
-        pg_chatbots = pg_db.get_all_chatbots()
-        
-        logger.info(f"Migration completed:")
-        logger.info(f"  - Total chatbots in MongoDB: {len(mongo_chatbots)}")
-        logger.info(f"  - Successfully migrated: {success_count}")
-        logger.info(f"  - Errors: {error_count}")
-        logger.info(f"  - Total chatbots in PostgreSQL: {len(pg_chatbots)}")
-        
-        # Return success status
-        return success_count == len(mongo_chatbots)
-        
+        return verify(mongo_db, pg_db, checkpoint) and checkpoint["errors"] == 0
+
     except ImportError as e:
         logger.error(f"Failed to import database modules: {e}")
         logger.error("Make sure both database.py and database_pg.py exist in the current directory.")
@@ -119,24 +234,44 @@ def migrate_data():
 
 def main():
     """Entry point for the script"""
+    parser = argparse.ArgumentParser(description="Migrate chatbots from MongoDB to PostgreSQL")
+    parser.add_argument("--batch-size", type=int, default=500, help="chatbots per upsert batch")
+    parser.add_argument("--workers", type=int, default=4, help="batches written in parallel")
+    parser.add_argument("--checkpoint-file", default=DEFAULT_CHECKPOINT_FILE)
+    parser.add_argument("--restart", action="store_true", help="ignore any existing checkpoint")
+    parser.add_argument("--backup", help="also append every streamed document to this NDJSON file")
+    parser.add_argument("--verify-only", action="store_true", help="only compare counts and checksums")
+    parser.add_argument("--yes", action="store_true", help="do not ask for confirmation")
+    args = parser.parse_args()
+
     print("=" * 80)
     print(" MongoDB to PostgreSQL Migration Tool ")
     print("=" * 80)
     print("\nThis script will migrate your chatbot data from MongoDB to PostgreSQL.")
     print("Make sure both databases are running and properly configured.")
-    print("A backup of your MongoDB data will be created before migration.")
-    
+    print("Existing PostgreSQL rows with the same uniqueId will be overwritten.")
+
     try:
+        if args.restart and os.path.exists(args.checkpoint_file):
+            os.remove(args.checkpoint_file)
+
         # Confirm with the user
-        choice = input("\nDo you want to proceed? (yes/no): ").strip().lower()
-        
-        if choice not in ('yes', 'y'):
-            print("Migration cancelled.")
-            return
-        
+        if not args.yes and not args.verify_only:
+            choice = input("\nDo you want to proceed? (yes/no): ").strip().lower()
+
+            if choice not in ('yes', 'y'):
+                print("Migration cancelled.")
+                return
+
         # Run the migration
-        success = migrate_data()
-        
+        success = migrate_data(
+            batch_size=args.batch_size,
+            workers=args.workers,
+            checkpoint_file=args.checkpoint_file,
+            backup_file=args.backup,
+            verify_only=args.verify_only
+        )
+
         if success:
             print("\n✅ Migration completed successfully!")
             print("\nNext steps:")
@@ -145,11 +280,12 @@ def main():
             print("3. If everything works, you can rename database_pg.py to database.py")
         else:
             print("\n❌ Migration failed. Please check the logs for details.")
-            
+            print(f"Progress is saved in {args.checkpoint_file}; run the script again to resume.")
+
     except KeyboardInterrupt:
-        print("\nMigration cancelled by user.")
+        print("\nMigration interrupted. Run the script again to resume from the last checkpoint.")
     except Exception as e:
         print(f"\n❌ An unexpected error occurred: {e}")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
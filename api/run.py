@@ -1,6 +1,39 @@
+import argparse
+import logging
+import os
+
 import uvicorn
 
+from connections import WS_PER_MESSAGE_DEFLATE, WS_PING_INTERVAL, WS_PING_TIMEOUT
+
 if __name__ == "__main__":
-    # For secure WebSockets with SSL
-    #ssl_context = ('path/to/fullchain.pem', 'path/to/privkey.pem')
-    uvicorn.run("main:app", host="0.0.0.0", port=8001)#, reload=True, ssl_context=ssl_context) 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Run the chatbot API")
+    parser.add_argument("--host", default=os.getenv("API_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("API_PORT", "8001")))
+    # Production: a supervisor process with one uvicorn worker per core sharing the port
+    parser.add_argument("--production", action="store_true",
+                        default=os.getenv("RUN_MODE", "").lower() == "production",
+                        help="prefork workers under a supervisor (also RUN_MODE=production)")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "0")),
+                        help="worker processes in production mode (default: one per CPU)")
+    args = parser.parse_args()
+
+    options = dict(
+        host=args.host,
+        port=args.port,
+        # Server-driven ping/pong so half-open sockets are detected and closed
+        ws_ping_interval=WS_PING_INTERVAL,
+        ws_ping_timeout=WS_PING_TIMEOUT,
+        # Compress frames when the client offers permessage-deflate
+        ws_per_message_deflate=WS_PER_MESSAGE_DEFLATE,
+    )
+
+    if args.production:
+        import supervisor
+        logging.basicConfig(level=logging.INFO)
+        config = uvicorn.Config("main:app", **options)
+        supervisor.Supervisor(config, args.workers or supervisor.default_workers()).run()
+    else:
+        # For secure WebSockets with SSL
+        #ssl_context = ('path/to/fullchain.pem', 'path/to/privkey.pem')
+        uvicorn.run("main:app", **options)#, reload=True, ssl_context=ssl_context)
@@ -0,0 +1,112 @@
+import bisect
+import logging
+import threading
+from typing import List, Dict, Any, Optional, Tuple, Set
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Fields searched by GET /chatbots/search, in ranking order
+SEARCH_FIELDS = ("name", "welcomeText")
+
+# Rank of a match: name prefix beats name substring beats welcome text substring
+RANK_NAME_PREFIX = 3
+RANK_NAME = 2
+RANK_WELCOME_TEXT = 1
+
+
+def trigrams(text: str) -> Set[str]:
+    """Every 3-character substring of already-lowercased text"""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def match_rank(name: str, welcome_text: str, query: str, prefix: bool) -> int:
+    """Rank of one chatbot for a lowercased query, 0 if it does not match"""
+    if name.startswith(query):
+        return RANK_NAME_PREFIX
+    if prefix:
+        return 0
+    if query in name:
+        return RANK_NAME
+    if query in welcome_text:
+        return RANK_WELCOME_TEXT
+    return 0
+
+
+class NgramIndex:
+    """
+    In-memory trigram index over chatbot names and welcome texts.
+
+    Substring queries of three or more characters only verify the chatbots whose
+    fields contain every trigram of the query; prefix queries bisect a sorted list
+    of names. Results are ordered like the PostgreSQL search: rank, then name,
+    then uniqueId.
+    """
+
+    def __init__(self, chatbots: List[Dict[str, Any]]):
+        self.chatbots: Dict[str, Dict[str, Any]] = {}
+        self.fields: Dict[str, Tuple[str, str]] = {}
+        self.postings: Dict[str, Set[str]] = {}
+        self.names: List[Tuple[str, str]] = []
+        for chatbot in chatbots:
+            unique_id = chatbot.get("uniqueId")
+            if not unique_id:
+                continue
+            name = (chatbot.get("name") or "").lower()
+            welcome_text = (chatbot.get("welcomeText") or "").lower()
+            self.chatbots[unique_id] = chatbot
+            self.fields[unique_id] = (name, welcome_text)
+            for gram in trigrams(name) | trigrams(welcome_text):
+                self.postings.setdefault(gram, set()).add(unique_id)
+            self.names.append((name, unique_id))
+        self.names.sort()
+
+    def candidates(self, query: str, prefix: bool) -> List[str]:
+        """uniqueIds that may match, narrowed by the index where the query allows it"""
+        if prefix:
+            start = bisect.bisect_left(self.names, (query, ""))
+            end = bisect.bisect_left(self.names, (query + "\U0010ffff", ""))
+            return [unique_id for _, unique_id in self.names[start:end]]
+        if len(query) < 3:
+            return list(self.chatbots)
+        # Intersect the shortest posting lists first
+        postings = sorted((self.postings.get(gram, set()) for gram in trigrams(query)), key=len)
+        found = set(postings[0])
+        for posting in postings[1:]:
+            found &= posting
+            if not found:
+                break
+        return list(found)
+
+    def search(self, query: str, prefix: bool = False, limit: int = 20,
+               offset: int = 0) -> Tuple[List[Dict[str, Any]], bool]:
+        """Return one page of ranked matches and whether more follow"""
+        query = query.lower()
+        matches = []
+        for unique_id in self.candidates(query, prefix):
+            name, welcome_text = self.fields[unique_id]
+            rank = match_rank(name, welcome_text, query, prefix)
+            if rank:
+                matches.append((-rank, name, unique_id))
+        matches.sort()
+        page = matches[offset:offset + limit + 1]
+        return [self.chatbots[unique_id] for _, _, unique_id in page[:limit]], len(page) > limit
+
+
+# One index per local storage file state, rebuilt when the file changes
+_index: Optional[NgramIndex] = None
+_index_key: Optional[Tuple[float, int]] = None
+_index_lock = threading.Lock()
+
+
+def get_index(storage_file, load) -> NgramIndex:
+    """Index for storage_file, rebuilt with load() whenever its mtime or size changes"""
+    global _index, _index_key
+    stat = storage_file.stat() if storage_file.exists() else None
+    key = (stat.st_mtime_ns, stat.st_size) if stat else None
+    with _index_lock:
+        if _index is None or key != _index_key:
+            _index = NgramIndex(load() if stat else [])
+            _index_key = key
+            logger.info(f"Built search index over {len(_index.chatbots)} local chatbots")
+        return _index
@@ -0,0 +1,407 @@
+"""
+Prefork supervisor for production serving (python run.py --production).
+
+The supervisor binds the listening socket once and starts WORKERS uvicorn
+processes that all accept from it. It then:
+
+* restarts workers that crash, backing off when one keeps failing at startup;
+* recycles workers after WORKER_MAX_REQUESTS requests (plus some jitter, so they
+  don't all restart together) or once their RSS grew WORKER_MAX_MEMORY_GROWTH_MB
+  past what it was when they started serving;
+* on SIGHUP, starts a new generation of workers and retires each old worker only
+  once its replacement is serving, so a broken deploy never empties the pool;
+* on SIGTERM/SIGINT, stops all workers gracefully.
+
+A retiring worker stops accepting, lets WebSocket answers and SSE streams that
+are in flight finish for up to WORKER_GRACEFUL_TIMEOUT seconds, and is killed if
+it is still around a few seconds after that.
+"""
+
+import os
+import time
+import random
+import signal
+import shutil
+import asyncio
+import logging
+import tempfile
+import multiprocessing
+from typing import List, Optional
+
+import uvicorn
+from uvicorn.config import Config
+from uvicorn.importer import import_from_string
+
+import worker_status
+
+# Setup logging
+logger = logging.getLogger("supervisor")
+
+# Requests served before a worker is recycled (0 disables), and the random extra per worker
+WORKER_MAX_REQUESTS = int(os.getenv("WORKER_MAX_REQUESTS", "20000"))
+WORKER_MAX_REQUESTS_JITTER = int(os.getenv("WORKER_MAX_REQUESTS_JITTER", "2000"))
+# RSS growth since a worker started serving that gets it recycled (0 disables; Linux only)
+WORKER_MAX_MEMORY_GROWTH_MB = float(os.getenv("WORKER_MAX_MEMORY_GROWTH_MB", "512"))
+# How long a retiring worker may spend finishing in-flight streams
+WORKER_GRACEFUL_TIMEOUT = float(os.getenv("WORKER_GRACEFUL_TIMEOUT", "60"))
+# How long a new worker may take to start serving before it is replaced
+WORKER_START_TIMEOUT = float(os.getenv("WORKER_START_TIMEOUT", "60"))
+
+# Restart delay after consecutive failed starts: 0.5s, 1s, 2s, ... up to 30s
+RESTART_BACKOFF_BASE = 0.5
+RESTART_BACKOFF_MAX = 30.0
+# A worker that exits sooner than this after starting counts as a failed start
+MIN_HEALTHY_UPTIME = 10.0
+# Extra time given after the graceful timeout before a worker is killed
+KILL_GRACE = 5.0
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def default_workers() -> int:
+    """CPUs this process may run on (respects container CPU sets)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def rss_mb(pid: int) -> Optional[float]:
+    """Resident memory of a process from /proc, or None where that is unavailable"""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class WorkerServer(uvicorn.Server):
+    """uvicorn.Server that reports its status and drains streams before shutting down"""
+
+    def __init__(self, config: Config, app, slot: int, generation: int):
+        super().__init__(config)
+        # The application object itself (config.loaded_app is wrapped in middleware)
+        self.app = app
+        self.slot = slot
+        self.generation = generation
+        self.status_name = f"worker-{os.getpid()}"
+        self.state = "starting"
+
+    def install_signal_handlers(self):
+        # Ctrl-C reaches the whole process group; the supervisor relays it as SIGTERM
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGTERM, self.handle_exit, signal.SIGTERM, None)
+
+    def write_status(self):
+        worker_stats = getattr(self.app.state, "worker_stats", None)
+        worker_status.write(self.status_name, {
+            "state": self.state,
+            "requests": self.server_state.total_requests,
+            "max_requests": self.config.limit_max_requests,
+            "connections": len(self.server_state.connections),
+            "updated_at": time.time(),
+            **(worker_stats() if worker_stats else {}),
+        })
+
+    async def on_tick(self, counter: int) -> bool:
+        should_exit = await super().on_tick(counter)
+        if self.state == "starting":
+            self.state = "serving"
+            self.write_status()
+        elif counter % 10 == 0:
+            self.write_status()
+        if should_exit and not self.should_exit:
+            logger.info(f"Worker {os.getpid()} recycling after {self.server_state.total_requests} requests")
+        return should_exit
+
+    async def shutdown(self, sockets=None):
+        self.state = "draining"
+        self.write_status()
+        deadline = time.monotonic() + WORKER_GRACEFUL_TIMEOUT
+        # Stop accepting first, so new connections go to the other workers while this one drains
+        for server in self.servers:
+            server.close()
+        # uvicorn closes open WebSockets with 1012 right away, so let their answers finish first
+        drain = getattr(self.app.state, "drain", None)
+        if drain is not None:
+            await drain(WORKER_GRACEFUL_TIMEOUT)
+        # Whatever is left of the budget goes to HTTP responses (SSE streams) still running
+        self.config.timeout_graceful_shutdown = max(1, int(deadline - time.monotonic()))
+        await super().shutdown(sockets=sockets)
+        worker_status.remove(self.status_name)
+
+
+def serve_worker(config: Config, sock, slot: int, generation: int):
+    """Entry point of a worker process"""
+    config.configure_logging()
+    app = import_from_string(config.app)
+    WorkerServer(config, app, slot, generation).run(sockets=[sock])
+
+
+class Worker:
+    """Supervisor-side handle of one worker process"""
+
+    def __init__(self, process, slot: int, generation: int):
+        self.process = process
+        self.slot = slot
+        self.generation = generation
+        self.started_at = time.time()
+        self.started = time.monotonic()
+        self.baseline_rss: Optional[float] = None
+        self.retiring: Optional[str] = None
+        self.kill_at: Optional[float] = None
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid
+
+    def alive(self) -> bool:
+        return self.process.is_alive()
+
+    def uptime(self) -> float:
+        return time.monotonic() - self.started
+
+    def serving(self) -> bool:
+        status = worker_status.read(f"worker-{self.pid}")
+        return bool(status) and status.get("state") == "serving"
+
+    def retire(self, reason: str):
+        """Ask the worker to drain and exit; it is killed if it overstays"""
+        if self.retiring is not None:
+            return
+        self.retiring = reason
+        self.kill_at = time.monotonic() + WORKER_GRACEFUL_TIMEOUT + KILL_GRACE
+        logger.info(f"Retiring worker {self.pid} (slot {self.slot}): {reason}")
+        try:
+            os.kill(self.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    def describe(self, role: str) -> dict:
+        rss = rss_mb(self.pid)
+        return {
+            "pid": self.pid,
+            "slot": self.slot,
+            "generation": self.generation,
+            "role": role,
+            "retiring": self.retiring,
+            "started_at": self.started_at,
+            "rss_mb": round(rss, 1) if rss is not None else None,
+            "rss_growth_mb": round(rss - self.baseline_rss, 1) if rss is not None and self.baseline_rss is not None else None,
+        }
+
+
+class Supervisor:
+    """Keeps `workers` uvicorn processes serving from one shared socket"""
+
+    def __init__(self, config: Config, workers: int):
+        self.config = config
+        self.workers = workers
+        self.context = multiprocessing.get_context("spawn")
+        self.sock = None
+        self.generation = 0
+        self.reloads = 0
+        self.started_at = time.time()
+        # Per slot: the serving worker, a replacement that is starting, and why one was started
+        self.current: List[Optional[Worker]] = [None] * workers
+        self.pending: List[Optional[Worker]] = [None] * workers
+        self.replace_reason: List[Optional[str]] = [None] * workers
+        self.restarts = [0] * workers
+        self.failures = [0] * workers
+        self.restart_at = [0.0] * workers
+        self.retiring: List[Worker] = []
+        self.signals: List[int] = []
+        self.owns_status_dir = False
+
+    def spawn(self, slot: int) -> Worker:
+        # Jitter the request limit so workers don't all recycle at the same moment
+        if WORKER_MAX_REQUESTS > 0:
+            self.config.limit_max_requests = WORKER_MAX_REQUESTS + random.randint(0, WORKER_MAX_REQUESTS_JITTER)
+        process = self.context.Process(
+            target=serve_worker,
+            kwargs={"config": self.config, "sock": self.sock, "slot": slot, "generation": self.generation},
+            name=f"worker-{slot}",
+        )
+        process.start()
+        logger.info(f"Started worker {process.pid} (slot {slot}, generation {self.generation})")
+        return Worker(process, slot, self.generation)
+
+    def backoff(self, slot: int):
+        """Delay the next start of a slot whose workers keep failing"""
+        self.failures[slot] += 1
+        delay = min(RESTART_BACKOFF_BASE * 2 ** (self.failures[slot] - 1), RESTART_BACKOFF_MAX)
+        self.restart_at[slot] = time.monotonic() + delay
+        logger.warning(f"Slot {slot} failed {self.failures[slot]} start(s) in a row; next start in {delay:.1f}s")
+
+    def check_slot(self, slot: int, now: float):
+        current = self.current[slot]
+        pending = self.pending[slot]
+
+        # A worker that exited on its own: recycled after max requests (exit code 0) or crashed
+        if current is not None and not current.alive():
+            exitcode = current.process.exitcode
+            self.current[slot] = None
+            self.restarts[slot] += 1
+            if exitcode == 0:
+                logger.info(f"Worker {current.pid} (slot {slot}) exited after {current.uptime():.0f}s; restarting")
+            else:
+                logger.error(f"Worker {current.pid} (slot {slot}) died with exit code {exitcode} "
+                             f"after {current.uptime():.0f}s")
+            if exitcode != 0 and current.uptime() < MIN_HEALTHY_UPTIME:
+                self.backoff(slot)
+            else:
+                self.failures[slot] = 0
+            if pending is not None:
+                # The replacement that was already starting takes over the slot
+                self.current[slot], self.pending[slot] = pending, None
+                self.replace_reason[slot] = None
+            return
+
+        if current is None:
+            if now >= self.restart_at[slot]:
+                self.current[slot] = self.spawn(slot)
+            return
+
+        # Recycle on memory growth, measured from the RSS the worker had once it was serving
+        if WORKER_MAX_MEMORY_GROWTH_MB > 0 and self.replace_reason[slot] is None:
+            rss = rss_mb(current.pid)
+            if rss is not None:
+                if current.baseline_rss is None:
+                    if current.serving():
+                        current.baseline_rss = rss
+                elif rss - current.baseline_rss > WORKER_MAX_MEMORY_GROWTH_MB:
+                    logger.warning(f"Worker {current.pid} grew {rss - current.baseline_rss:.0f} MB "
+                                   f"(limit {WORKER_MAX_MEMORY_GROWTH_MB:.0f} MB)")
+                    self.replace_reason[slot] = "memory growth"
+
+        # Hand the slot over to a replacement once it serves; the old worker keeps serving until then
+        reason = self.replace_reason[slot]
+        if reason is None:
+            return
+        if pending is None:
+            if now >= self.restart_at[slot]:
+                self.pending[slot] = self.spawn(slot)
+        elif not pending.alive():
+            logger.error(f"Replacement worker {pending.pid} (slot {slot}) died with exit code "
+                         f"{pending.process.exitcode} before serving; keeping worker {current.pid}")
+            self.pending[slot] = None
+            self.backoff(slot)
+        elif pending.serving():
+            current.retire(reason)
+            self.retiring.append(current)
+            self.current[slot], self.pending[slot] = pending, None
+            self.replace_reason[slot] = None
+            self.failures[slot] = 0
+        elif pending.uptime() > WORKER_START_TIMEOUT:
+            logger.error(f"Replacement worker {pending.pid} (slot {slot}) not serving after {WORKER_START_TIMEOUT:.0f}s")
+            pending.retire("start timeout")
+            self.retiring.append(pending)
+            self.pending[slot] = None
+            self.backoff(slot)
+
+    def check_retiring(self, now: float):
+        for worker in list(self.retiring):
+            if not worker.alive():
+                logger.info(f"Worker {worker.pid} (slot {worker.slot}) finished draining")
+                self.retiring.remove(worker)
+                worker_status.remove(f"worker-{worker.pid}")
+            elif now >= worker.kill_at:
+                logger.error(f"Killing worker {worker.pid}: still draining after {WORKER_GRACEFUL_TIMEOUT:.0f}s")
+                worker.process.kill()
+
+    def reload(self):
+        """Start a new generation; each old worker retires once its replacement serves"""
+        self.generation += 1
+        self.reloads += 1
+        logger.info(f"Reloading: starting worker generation {self.generation}")
+        for slot in range(self.workers):
+            # A replacement from the previous generation would run old code
+            pending = self.pending[slot]
+            if pending is not None:
+                pending.retire("superseded by reload")
+                self.retiring.append(pending)
+                self.pending[slot] = None
+            if self.current[slot] is not None:
+                self.replace_reason[slot] = "reload"
+            self.failures[slot] = 0
+            self.restart_at[slot] = 0.0
+
+    def write_status(self):
+        workers = []
+        for slot in range(self.workers):
+            if self.current[slot] is not None:
+                workers.append({**self.current[slot].describe("current"), "restarts": self.restarts[slot]})
+            if self.pending[slot] is not None:
+                workers.append({**self.pending[slot].describe("replacement"), "restarts": self.restarts[slot]})
+        workers.extend(worker.describe("retiring") for worker in self.retiring)
+        worker_status.write("supervisor", {
+            "pid": os.getpid(),
+            "started_at": self.started_at,
+            "workers_target": self.workers,
+            "generation": self.generation,
+            "reloads": self.reloads,
+            "updated_at": time.time(),
+            "workers": workers,
+        })
+
+    def handle_signal(self, sig, frame):
+        self.signals.append(sig)
+
+    def stop(self):
+        """Retire every worker and wait for them (killing stragglers) before returning"""
+        workers = [w for w in self.current + self.pending if w is not None] + self.retiring
+        for worker in workers:
+            worker.retire("shutdown")
+        self.retiring = workers
+        while self.retiring:
+            # A second Ctrl-C / SIGTERM skips the drain
+            if self.signals:
+                self.signals.clear()
+                logger.warning(f"Killing {len(self.retiring)} draining worker(s)")
+                for worker in self.retiring:
+                    worker.kill_at = 0.0
+            self.check_retiring(time.monotonic())
+            self.write_status()
+            time.sleep(0.2)
+
+    def run(self):
+        # Where the workers and GET /admin/workers find each other's status
+        if worker_status.status_dir() is None:
+            os.environ[worker_status.STATUS_DIR_ENV] = tempfile.mkdtemp(prefix="chat-api-workers-")
+            self.owns_status_dir = True
+        worker_status.status_dir().mkdir(parents=True, exist_ok=True)
+
+        # One listening socket, inherited by every worker
+        self.sock = self.config.bind_socket()
+        self.config.timeout_graceful_shutdown = int(WORKER_GRACEFUL_TIMEOUT)
+
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(sig, self.handle_signal)
+        logger.info(f"Supervisor {os.getpid()} starting {self.workers} worker(s); "
+                    f"SIGHUP reloads, SIGTERM stops")
+
+        try:
+            last_status = 0.0
+            while True:
+                while self.signals:
+                    sig = self.signals.pop(0)
+                    if sig == signal.SIGHUP:
+                        self.reload()
+                    else:
+                        logger.info(f"Received {signal.Signals(sig).name}; stopping workers")
+                        return
+                now = time.monotonic()
+                for slot in range(self.workers):
+                    self.check_slot(slot, now)
+                self.check_retiring(now)
+                if now - last_status >= 1:
+                    self.write_status()
+                    last_status = now
+                time.sleep(0.2)
+        finally:
+            self.stop()
+            self.sock.close()
+            if self.owns_status_dir:
+                shutil.rmtree(worker_status.status_dir(), ignore_errors=True)
+            logger.info("Supervisor stopped")
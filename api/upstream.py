@@ -0,0 +1,52 @@
+import os
+import logging
+import importlib
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Shared connection pool to the NextAGI API
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100"))
+UPSTREAM_MAX_KEEPALIVE = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "20"))
+UPSTREAM_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", "60"))
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "5"))
+
+# httpx is imported on first use (or during warm-up, off the event loop) to keep cold start short
+_client = None
+
+
+def get_client():
+    """The process-wide httpx.AsyncClient, created on first use"""
+    global _client
+    if _client is None:
+        httpx = importlib.import_module("httpx")
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(UPSTREAM_TIMEOUT, connect=UPSTREAM_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=UPSTREAM_MAX_CONNECTIONS,
+                                max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE),
+        )
+    return _client
+
+
+def preload():
+    """Import httpx; meant to run in a worker thread during startup"""
+    importlib.import_module("httpx")
+
+
+async def warm_up(base_url: str) -> bool:
+    """Open a keep-alive connection (DNS, TCP, TLS) to the upstream so the first chat doesn't pay for it"""
+    try:
+        response = await get_client().head(base_url, timeout=UPSTREAM_CONNECT_TIMEOUT)
+        logger.info(f"Upstream {base_url} reachable (status {response.status_code})")
+        return True
+    except Exception as e:
+        logger.warning(f"Upstream warm-up to {base_url} failed: {e}")
+        return False
+
+
+async def close():
+    """Close pooled upstream connections"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -0,0 +1,111 @@
+import os
+import gzip
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+# Brotli is optional; without it widgets are served gzip or uncompressed
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Fields a widget needs to render; everything else (apiKey, analyticsUrl) stays private
+WIDGET_FIELDS = (
+    "uniqueId",
+    "name",
+    "chatLogoColor",
+    "chatLogoImage",
+    "iconAvatarImage",
+    "staticImage",
+    "chatHeaderColor",
+    "chatBgGradientStart",
+    "chatBgGradientEnd",
+    "bodyBackgroundImage",
+    "welcomeText",
+)
+
+# Cached widgets kept per process, and how long one is trusted without re-reading its version
+WIDGET_CACHE_SIZE = int(os.getenv("WIDGET_CACHE_SIZE", "1000"))
+WIDGET_CACHE_TTL = float(os.getenv("WIDGET_CACHE_TTL", "30"))
+# Browser/CDN caching of widget responses; revalidation is cheap thanks to the ETag
+WIDGET_CACHE_CONTROL = os.getenv("WIDGET_CACHE_CONTROL", "public, max-age=60, stale-while-revalidate=300")
+
+# Compression runs once per chatbot version, so the slowest (smallest) settings are affordable
+WIDGET_BROTLI_QUALITY = int(os.getenv("WIDGET_BROTLI_QUALITY", "11"))
+# Skip compressing bodies too small to benefit
+MIN_COMPRESS_BYTES = 512
+
+
+class WidgetEntry:
+    """Pre-serialized (and pre-compressed) widget bytes for one chatbot version"""
+
+    __slots__ = ("etag", "identity", "gzip", "br", "expires_at")
+
+    def __init__(self, chatbot: Dict[str, Any], version: str):
+        widget = {field: chatbot.get(field) for field in WIDGET_FIELDS if chatbot.get(field) is not None}
+        self.etag = f"w-{version}"
+        self.identity = json.dumps(widget, separators=(",", ":")).encode("utf-8")
+        self.gzip = None
+        self.br = None
+        if len(self.identity) >= MIN_COMPRESS_BYTES:
+            self.gzip = gzip.compress(self.identity, compresslevel=9, mtime=0)
+            if brotli is not None:
+                self.br = brotli.compress(self.identity, quality=WIDGET_BROTLI_QUALITY)
+        self.expires_at = time.monotonic() + WIDGET_CACHE_TTL
+
+    def body(self, accept_encoding: str):
+        """Smallest encoding the client accepts, as (bytes, Content-Encoding or None)"""
+        # "br;q=0" means refused, so only encodings without a zero quality count
+        accepted = {part.split(";")[0].strip().lower() for part in accept_encoding.split(",")
+                    if not part.replace(" ", "").lower().endswith(";q=0")}
+        if self.br is not None and "br" in accepted:
+            return self.br, "br"
+        if self.gzip is not None and ("gzip" in accepted or "*" in accepted):
+            return self.gzip, "gzip"
+        return self.identity, None
+
+
+_entries: "OrderedDict[str, WidgetEntry]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def lookup(unique_id: str) -> Optional[WidgetEntry]:
+    """Cached widget for unique_id, or None if missing or older than WIDGET_CACHE_TTL"""
+    with _lock:
+        entry = _entries.get(unique_id)
+        if entry is None:
+            return None
+        if entry.expires_at < time.monotonic():
+            del _entries[unique_id]
+            return None
+        _entries.move_to_end(unique_id)
+        return entry
+
+
+def store(unique_id: str, chatbot: Dict[str, Any], version: str) -> WidgetEntry:
+    """Build and cache the widget for one chatbot version (compression happens here, once)"""
+    entry = WidgetEntry(chatbot, version)
+    with _lock:
+        _entries[unique_id] = entry
+        _entries.move_to_end(unique_id)
+        while len(_entries) > WIDGET_CACHE_SIZE:
+            _entries.popitem(last=False)
+    logger.info(f"Cached widget for chatbot {unique_id}: {len(entry.identity)} bytes, "
+                f"gzip {len(entry.gzip) if entry.gzip else '-'}, br {len(entry.br) if entry.br else '-'}")
+    return entry
+
+
+def invalidate(unique_id: Optional[str] = None):
+    """Drop one cached widget, or all of them"""
+    with _lock:
+        if unique_id is None:
+            _entries.clear()
+        else:
+            _entries.pop(unique_id, None)
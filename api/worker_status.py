@@ -0,0 +1,72 @@
+"""
+Status files shared between the production supervisor (run.py --production) and
+its workers.
+
+Every process writes one small JSON file into WORKER_STATUS_DIR (replaced
+atomically), so any worker can answer GET /admin/workers with the state of all of
+them without talking to the others.
+"""
+
+import os
+import json
+import logging
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Set by the supervisor for its workers; unset when running a single process
+STATUS_DIR_ENV = "WORKER_STATUS_DIR"
+
+
+def status_dir() -> Optional[Path]:
+    path = os.getenv(STATUS_DIR_ENV)
+    return Path(path) if path else None
+
+
+def write(name: str, status: Dict[str, Any]):
+    """Replace <name>.json in the status directory; a no-op outside production mode"""
+    directory = status_dir()
+    if directory is None:
+        return
+    path = directory / f"{name}.json"
+    tmp_path = directory / f".{name}.json.tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump(status, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Could not write worker status {path}: {e}")
+
+
+def remove(name: str):
+    directory = status_dir()
+    if directory is not None:
+        try:
+            (directory / f"{name}.json").unlink()
+        except FileNotFoundError:
+            pass
+
+
+def read(name: str) -> Optional[Dict[str, Any]]:
+    directory = status_dir()
+    if directory is None:
+        return None
+    try:
+        with open(directory / f"{name}.json") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def read_all() -> Dict[str, Any]:
+    """The supervisor's view merged with what each live worker last reported about itself"""
+    supervisor = read("supervisor")
+    if supervisor is None:
+        return {"mode": "single", "workers": []}
+    workers: List[Dict[str, Any]] = []
+    for worker in supervisor.get("workers", []):
+        reported = read(f"worker-{worker['pid']}") or {}
+        workers.append({**worker, **reported})
+    return {**supervisor, "mode": "production", "workers": workers}
@@ -0,0 +1,93 @@
+"""
+Frame encodings for the /ws chat endpoint.
+
+Version 1 is the original JSON text protocol, repeating the conversation id on
+every chunk. Version 2 is opt-in: the client advertises it in its ``init``
+message (``{"type": "init", "protocol": 2}``) and the server acknowledges with
+``{"t": "i", "v": 2}``. In version 2:
+
+* ``{"t": "s", "c": <conversation_id>}`` opens a stream, once per answer
+* chunks are binary frames: one ``0x01`` type byte followed by UTF-8 text
+* ``{"t": "e"}`` ends the stream
+* ``{"t": "x", "m": <message>}`` reports an error
+"""
+
+import json
+from typing import List, Optional, Union
+
+Frame = Union[str, bytes]
+
+PROTOCOL_JSON = 1
+PROTOCOL_COMPACT = 2
+SUPPORTED_PROTOCOLS = (PROTOCOL_JSON, PROTOCOL_COMPACT)
+
+BINARY_CHUNK = b"\x01"
+
+
+class JsonFrameEncoder:
+    """Version 1: self-describing JSON text frames"""
+
+    version = PROTOCOL_JSON
+
+    def init(self) -> List[Frame]:
+        return [json.dumps({"type": "init", "protocol": self.version})]
+
+    def chunk(self, content: str, conversation_id: str) -> List[Frame]:
+        return [json.dumps({
+            "type": "chunk",
+            "content": content,
+            "conversation_id": conversation_id
+        })]
+
+    def end(self, conversation_id: str) -> List[Frame]:
+        return [json.dumps({
+            "type": "end",
+            "conversation_id": conversation_id
+        })]
+
+    def error(self, message: str) -> List[Frame]:
+        return [json.dumps({
+            "type": "error",
+            "content": message
+        })]
+
+
+class CompactFrameEncoder:
+    """Version 2: conversation id once per stream, binary chunk frames"""
+
+    version = PROTOCOL_COMPACT
+
+    def __init__(self):
+        self.stream_conversation_id: Optional[str] = None
+
+    def init(self) -> List[Frame]:
+        return [json.dumps({"t": "i", "v": self.version}, separators=(",", ":"))]
+
+    def chunk(self, content: str, conversation_id: str) -> List[Frame]:
+        frames: List[Frame] = []
+        if conversation_id != self.stream_conversation_id:
+            self.stream_conversation_id = conversation_id
+            frames.append(json.dumps({"t": "s", "c": conversation_id}, separators=(",", ":")))
+        frames.append(BINARY_CHUNK + content.encode("utf-8"))
+        return frames
+
+    def end(self, conversation_id: str) -> List[Frame]:
+        frames: List[Frame] = []
+        if conversation_id != self.stream_conversation_id:
+            frames.append(json.dumps({"t": "s", "c": conversation_id}, separators=(",", ":")))
+        self.stream_conversation_id = None
+        frames.append('{"t":"e"}')
+        return frames
+
+    def error(self, message: str) -> List[Frame]:
+        return [json.dumps({"t": "x", "m": message}, separators=(",", ":"))]
+
+
+def negotiate_encoder(requested) -> Union[JsonFrameEncoder, CompactFrameEncoder]:
+    """Pick the best protocol the client advertised (a version number or a list of them)"""
+    if isinstance(requested, list):
+        offered = [v for v in requested if v in SUPPORTED_PROTOCOLS]
+        requested = max(offered) if offered else PROTOCOL_JSON
+    if requested == PROTOCOL_COMPACT:
+        return CompactFrameEncoder()
+    return JsonFrameEncoder()
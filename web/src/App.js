@@ -30,6 +30,23 @@ const getWebSocketUrl = () => {
 const ws_base_url = getWebSocketUrl();
 console.log('Using WebSocket URL:', ws_base_url);
 
+// HTTP API base URL, resolved the same way as in the dashboard
+const getApiBaseUrl = () => {
+    const hostname = window.location.hostname;
+    
+    if (process.env.REACT_APP_API_URL) {
+        return process.env.REACT_APP_API_URL;
+    }
+    
+    if (hostname === 'localhost' || hostname === '127.0.0.1') {
+        return 'http://localhost:8001';
+    }
+    
+    return `${window.location.protocol}//${hostname}/api`;
+};
+
+const API_BASE_URL = getApiBaseUrl();
+
 function App() {
     // Get URL parameters
     const { name, uniqueId } = useParams();
@@ -104,6 +121,23 @@ function App() {
                     console.error('Error finding chatbot by URL params:', e);
                 }
             }
+            
+            // Otherwise fetch the public widget config (no API key; the server resolves it by uniqueId)
+            const controller = new AbortController();
+            fetch(`${API_BASE_URL}/chatbots/${encodeURIComponent(uniqueId)}/widget`, { signal: controller.signal })
+                .then(response => {
+                    if (!response.ok) {
+                        throw new Error(`Widget request failed with status ${response.status}`);
+                    }
+                    return response.json();
+                })
+                .then(widget => setConfig(prevConfig => ({ ...prevConfig, ...widget, apiKey: '' })))
+                .catch(e => {
+                    if (e.name !== 'AbortError') {
+                        console.error('Error loading chatbot widget config:', e);
+                    }
+                });
+            return () => controller.abort();
         }
         
         //console.log('Using default bot configuration');
@@ -138,15 +172,52 @@ function App() {
 
     // Initialize and handle WebSocket connection
     useEffect(() => {
-        if (!config.apiKey) {
+        if (!config.apiKey && !config.uniqueId) {
             console.warn("No API key configured, chat functionality will be limited");
             return;
         }
         
         // For WebSocket connection, we'll use client_id in the URL for compatibility
         // and pass the API key in the messages
-        const clientId = `client-${Date.now()}`;
+        // Date.now() alone collides when several widgets open in the same millisecond
+        const clientId = window.crypto && window.crypto.randomUUID
+            ? `client-${window.crypto.randomUUID()}`
+            : `client-${Date.now()}-${Math.random().toString(36).slice(2, 10)}`;
         const ws = new WebSocket(`${ws_base_url}/${clientId}`);
+        // Compact protocol (v2) sends answer chunks as binary frames
+        ws.binaryType = 'arraybuffer';
+        const textDecoder = new TextDecoder();
+        let streamConversationId = '';
+        
+        // Normalize v1 JSON frames and v2 compact frames to the v1 message shape
+        const decodeFrame = (frame) => {
+            if (frame instanceof ArrayBuffer) {
+                const bytes = new Uint8Array(frame);
+                if (bytes[0] === 1) {
+                    return {
+                        type: 'chunk',
+                        content: textDecoder.decode(bytes.subarray(1)),
+                        conversation_id: streamConversationId
+                    };
+                }
+                return {};
+            }
+            const data = JSON.parse(frame);
+            if (data.type) {
+                return data;
+            }
+            switch (data.t) {
+                case 's':
+                    streamConversationId = data.c;
+                    return { type: 'start', conversation_id: data.c };
+                case 'e':
+                    return { type: 'end', conversation_id: streamConversationId };
+                case 'x':
+                    return { type: 'error', content: data.m };
+                default:
+                    return {};
+            }
+        };
         
         ws.onopen = () => {
             //console.log('WebSocket connection established to:', ws.url);
@@ -154,7 +225,9 @@ function App() {
             // Send an initial message with the API key to set it up
             const initMessage = {
                 api_key: config.apiKey,
-                type: "init"
+                chatbot_id: config.uniqueId,
+                type: "init",
+                protocol: 2
             };
             ws.send(JSON.stringify(initMessage));
             
@@ -163,7 +236,7 @@ function App() {
         };
 
         ws.onmessage = (event) => {
-            const data = JSON.parse(event.data);
+            const data = decodeFrame(event.data);
             //console.log('Received message:', data);
 
             if (data.conversation_id) {
@@ -274,7 +347,7 @@ function App() {
                 ws.close();
             }
         };
-    }, [config.apiKey]);
+    }, [config.apiKey, config.uniqueId]);
 
     // Auto-resize the input text area and scroll to bottom
     useEffect(() => {
@@ -214,10 +214,45 @@ function Dashboard() {
         return Math.random().toString(36).substring(2, 12);
     }
 
-    // Filter chatbots based on search term
-    const filteredChatbots = chatbots.filter(bot => 
-        bot.name.toLowerCase().includes(searchTerm.toLowerCase())
-    );
+    // Search on the server (debounced) so large accounts don't filter everything client-side
+    const [searchResults, setSearchResults] = useState(null);
+    useEffect(() => {
+        const term = searchTerm.trim();
+        if (!term) {
+            setSearchResults(null);
+            return;
+        }
+        const controller = new AbortController();
+        const timer = setTimeout(async () => {
+            try {
+                const response = await fetch(
+                    `${API_BASE_URL}/chatbots/search?q=${encodeURIComponent(term)}&limit=100`,
+                    { signal: controller.signal }
+                );
+                if (!response.ok) {
+                    throw new Error(`Search failed with status ${response.status}`);
+                }
+                const data = await response.json();
+                setSearchResults(data.results);
+            } catch (searchError) {
+                if (searchError.name !== 'AbortError') {
+                    console.warn('Server search failed, filtering locally:', searchError);
+                    setSearchResults(null);
+                }
+            }
+        }, 250);
+        return () => {
+            clearTimeout(timer);
+            controller.abort();
+        };
+    }, [searchTerm, lastUpdated]);
+
+    // Use the server results, or filter the loaded chatbots while offline
+    const filteredChatbots = searchTerm.trim() && searchResults !== null
+        ? searchResults
+        : chatbots.filter(bot =>
+            bot.name.toLowerCase().includes(searchTerm.toLowerCase())
+        );
 
     // Fetch chatbots from the API
     const fetchChatbots = async (isRetry = false) => {